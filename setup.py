@@ -28,4 +28,8 @@ setup(
     entry_points={"console_scripts": scripts},
     version=version,
     packages=find_packages(),
-    install_requires=deps)
+    install_requires=deps,
+    extras_require={
+        "numpy": ["numpy"],
+        "zstd": ["zstandard"],
+        "lz4": ["lz4"]})
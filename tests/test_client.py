@@ -0,0 +1,94 @@
+import time
+
+import pytest
+
+from titanclient.api.client import APIClient
+from titanclient.api.session import sessions
+from titanclient.api.discovery import DiscoveryCache, discovery_cache
+from titanclient.api.simulator import FakeTitanSim, FakeAdapter, SCENARIOS
+
+
+URL = "http://192.0.2.1:8080/api.dsapi"
+ROWS = [ list(row) for row in SCENARIOS ]
+
+
+@pytest.fixture
+def sim(tmp_path, monkeypatch):
+    monkeypatch.setattr(discovery_cache, "cachedir", str(tmp_path))
+    sim = FakeTitanSim()
+    sessions.mount(URL, FakeAdapter(sim))
+    yield sim
+    sessions.unmount(URL)
+
+
+def test_discovery_cache_round_trip(tmp_path, monkeypatch):
+    cache = DiscoveryCache(cachedir=str(tmp_path), entries=2)
+    assert cache.current(URL, 60) == (None, None)
+
+    cache.put(URL, "a", ROWS[:1])
+    rows, checked = cache.current(URL, 60)
+    assert rows == ROWS[:1] and time.time() - checked < 1
+    cache.put(URL, "b", ROWS[:2])
+    cache.put(URL, "c", ROWS)
+    assert cache.fingerprints(URL) == [ "b", "c" ]
+
+    # stale after the TTL, but still the latest and found by fingerprint
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.current(URL, 60) == (None, None)
+    assert cache.latest(URL) == ROWS
+    assert cache.get(URL, "a") is None
+    assert cache.get(URL, "b") == ROWS[:2]
+    assert cache.current(URL, 60) == (ROWS[:2], now + 61)
+
+
+def test_discovery_ttl_runs_from_cached_check(sim, monkeypatch):
+    APIClient("192.0.2.1", discovery_ttl=60).scenarios()
+    discovered = sim.requests
+
+    # a new client within the TTL is served from the cache
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 50)
+    client = APIClient("192.0.2.1", discovery_ttl=60)
+    assert len(client.scenarios()) == len(SCENARIOS)
+    assert sim.requests == discovered
+
+    # which was checked 50s ago, so it expires 10s later
+    monotonic = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: monotonic + 11)
+    client.scenarios()
+    assert sim.requests == discovered + 1
+
+
+def test_batch_templates_dropped_on_scenario_change(sim):
+    client = APIClient("192.0.2.1")
+    request = client._batch("call_cps")
+    assert client._batch("call_cps") is request
+    client.refresh()
+    assert client._batch("call_cps") is request
+
+    # relaunched with another configuration
+    sessions.mount(URL, FakeAdapter(FakeTitanSim(SCENARIOS[:1])))
+    client.refresh()
+    assert client._batch("call_cps") is not request
+    assert list(client.batch("call_cps").keys()) == [ "0010PsPs_A" ]
+
+
+@pytest.mark.parametrize("stats", [
+    [ "call_cps" ],
+    [ "status" ],
+    [ "call_cps", "message_cps", "call_total", "status", "gos", "failed", "is_running", "protocol", "nosuch" ]])
+@pytest.mark.parametrize("name_filter", [ "", "0010PsPs_A" ])
+def test_batch_decoder_matches_processed_response(sim, stats, name_filter):
+    client = APIClient("192.0.2.1")
+    request = client._batch(stats, name_filter=name_filter)
+    decoded = request.send()
+    table = request.send(table=True)
+
+    decoder, request._decoder = request._decoder, None
+    try:
+        processed = request.send()
+    finally:
+        request._decoder = decoder
+    assert decoded == processed
+    assert table.to_dict() == processed
@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+from titanclient.host.connection import SSHClient, FileTransfer, _choose
+
+
+def client():
+    return SSHClient(SimpleNamespace(config=SimpleNamespace(hostname="h", username="u", password="p")))
+
+
+def test_bandwidth_is_smoothed():
+    ssh = client()
+    ssh._measure(100e6)
+    ssh._measure(10e6)
+    assert 10e6 < ssh.bandwidth < 100e6
+
+
+def test_compressed_transfer_only_raises_bandwidth():
+    ssh = client()
+    ssh._measure(50e6)
+    ssh._measure(1e6, bound=True)
+    assert ssh.bandwidth == 50e6
+    ssh._measure(150e6, bound=True)
+    assert 50e6 < ssh.bandwidth < 150e6
+
+
+def test_choose():
+    assert _choose(["zstd", "lz4"], 0.9, 1e6) == "zstd"
+    assert _choose(["zstd", "lz4"], 0.1, 1e6) == "lz4"
+    assert _choose([], 0.1, 1e6) == "gzip:1"
+    assert _choose(["lz4"], 0.9, 1e9) == "none"
+
+
+def test_unmeasured_link_gets_cheap_codec():
+    assert _choose(["zstd", "lz4"], 0.9, None) == "lz4"
+    assert _choose(["zstd"], 0.9, None) == "gzip:1"
+
+
+def test_select_codec_does_not_probe_link():
+    ssh = client()
+    commands = []
+    ssh.run = lambda command, stdin=None: commands.append(command) or ("8\n0.5\n", "", 0)
+    assert ssh.select_codec() == "gzip:1"
+    assert len(commands) == 1
+    assert ssh.bandwidth is None
+
+
+def test_concurrent_polls():
+    transfer = FileTransfer(client(), "/logs", "/tmp")
+    transfer.poller = lambda t: t.status()
+    transfer.period = 0
+
+    def stream(n):
+        for i in range(200):
+            transfer.poll(f"{n}_{i}", 10, 5)
+            transfer.status()
+
+    with ThreadPoolExecutor(max_workers=8) as e:
+        list(e.map(stream, range(8)))
+    assert transfer.status()["files"] == 1600
+    assert transfer.end_date is None
+    transfer.poll("0_0", 10, 10)
+    assert transfer.end_date is None
@@ -0,0 +1,37 @@
+from titanclient.host.files.gpl import GPLData
+
+
+HEADER = (
+    '#CaptureGroup["caseA"]\n'
+    '#TimeStampBase: 2026-03-01-10:00:00.000000 \n'
+    '#ValueHeader[""] caseA.registration.nofTotal caseA.call.nofTotal \n')
+
+
+def records(start, end):
+    return "".join("r {}.0 {} {} \n".format(i, i, i * 2) for i in range(start, end))
+
+
+def test_update_matches_load(tmp_path):
+    path = tmp_path / "a.gpl"
+    path.write_text(HEADER + records(0, 10) + "r 10.0 1")
+    data = GPLData(str(path))
+    assert len(data.stats["caseA"]["records"]) == 10
+
+    with open(path, "a") as f:
+        f.write("0 20 \n" + records(11, 20))
+    data.update([str(path)])
+
+    assert data.stats == GPLData(str(path)).stats
+    assert data.registration_total("caseA") == 19
+
+
+def test_update_reloads_rewritten_file(tmp_path):
+    path = tmp_path / "a.gpl"
+    path.write_text(HEADER + records(0, 10))
+    data = GPLData(str(path))
+
+    path.write_text(HEADER + records(5, 30))
+    data.update([str(path)])
+
+    assert data.stats == GPLData(str(path)).stats
+    assert len(data.stats["caseA"]["records"]) == 25
@@ -0,0 +1,76 @@
+import os
+import time
+import subprocess
+
+import pytest
+
+from titanclient.common.config import settings
+from titanclient.host.cache import load_index
+from titanclient.host.client import HostClient
+
+
+class LocalSSH:
+
+    """
+    Runs commands of `HostClient` locally instead of on the host.
+    """
+
+    def __init__(self):
+        self.commands = []
+
+    def run(self, command, stdin=None):
+        self.commands.append(command)
+        p = subprocess.run(["sh", "-c", command], input=stdin, capture_output=True)
+        return p.stdout.decode("UTF-8"), p.stderr.decode("UTF-8"), p.returncode
+
+
+def make_log(log_path, name, mtime, stat=True):
+    path = os.path.join(log_path, name)
+    os.makedirs(os.path.join(path, "stat") if stat else path)
+    with open(os.path.join(path, "ts.cfg"), "w") as f:
+        f.write("x")
+    os.utime(os.path.join(path, "ts.cfg"), (mtime - 60, mtime - 60))
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+@pytest.fixture
+def host(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "cachedir", str(tmp_path / "cache"))
+    install_dir = tmp_path / "install"
+    os.makedirs(install_dir / "log")
+    return HostClient(config={"hostname": "h", "install_dir": str(install_dir)}, client=LocalSSH())
+
+
+def test_log_index_detects_changes(host):
+    log_path = f"{host.config.install_dir}/log/"
+    old = time.time() - 3600
+    a = make_log(log_path, "a", old)
+    b = make_log(log_path, "b", old, stat=False)
+
+    logs = host.logs()
+    assert [ (l.name, l.runtime, l.available("gpl")) for l in logs ] == [ ("a", 60, True), ("b", 60, False) ]
+    assert sorted(load_index(host, log_path)["logs"]) == [ a, b ]
+
+    # unchanged directories are taken from the index
+    os.remove(os.path.join(a, "ts.cfg"))
+    os.utime(a, (old, old))
+    # changed, new and moved-in (older than the index) directories are scanned
+    os.makedirs(os.path.join(b, "stat"))
+    changed = int(time.time())
+    os.utime(b, (changed, changed))
+    make_log(log_path, "c", time.time())
+    make_log(log_path, "d", old - 3600)
+
+    logs = host.logs()
+    assert [ (l.name, l.runtime, l.available("gpl")) for l in logs ] == [
+        ("a", 60, True), ("b", changed - int(old - 60), True), ("c", 60, True), ("d", 60, True) ]
+
+    # removed directories are dropped from the index
+    os.rename(os.path.join(a, "stat"), os.path.join(a, "x"))
+    os.rmdir(os.path.join(a, "x"))
+    os.rmdir(a)
+    assert [ l.name for l in host.logs() ] == [ "b", "c", "d" ]
+    assert sorted(load_index(host, log_path)["logs"]) == [ b, os.path.join(log_path, "c"), os.path.join(log_path, "d") ]
+
+    assert [ l.name for l in host.logs(rescan=True) ] == [ "b", "c", "d" ]
@@ -0,0 +1,143 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from titanclient.common.config import settings
+from titanclient.api.playlist import Playlist, StatWriter, _clock, _workers, _map
+from titanclient.api.simulator import VirtualClock
+
+
+SIMULATORS = """
+simulators:
+  - name: ts1
+    address: 127.0.0.1
+"""
+
+
+def playlist(tmp_path, steps, **kwargs):
+    path = tmp_path / "playlist.yaml"
+    path.write_text(SIMULATORS + "playlist:\n" + steps)
+    return Playlist(str(path), **kwargs)
+
+
+def test_compile_label_in_parallel_block(tmp_path):
+    with pytest.raises(Exception) as e:
+        playlist(tmp_path, """
+  - wait: 1s
+  - parallel:
+      steps:
+        - - label: x
+          - wait: 1s
+        - wait: 2s
+  - jump: y
+""")
+    assert str(e.value).splitlines()[1:] == [
+        "2.1: label not allowed in parallel block",
+        "3: unknown label y"]
+
+
+def test_resume_truncates_to_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    outdata = { "ts1": { "Ålesund_é": { "cps": 1.5 } } }
+    writer = StatWriter("out", fmt="csv")
+    writer.write("1", outdata, ["cps"])
+    state = writer.checkpoint()
+    writer.write("2", outdata, ["cps"])
+    writer.close()
+
+    # resume from another working directory
+    monkeypatch.chdir(tmp_path.parent)
+    resumed = StatWriter(str(tmp_path / "out"), fmt="csv")
+    resumed.restore(state)
+    resumed.write("2", outdata, ["cps"])
+    resumed.close()
+
+    with open(state["paths"][-1], encoding="utf-8") as f:
+        rows = f.read().splitlines()
+    assert [ row.split(",")[1] for row in rows[1:] ] == [ "1", "2" ]
+    assert all(row.endswith("Ålesund_é,cps,1.5") for row in rows[1:])
+
+
+def test_resume_discards_rotated_files(tmp_path):
+    outdata = { "ts1": { "A": { "cps": 1.5 } } }
+    writer = StatWriter(str(tmp_path), fmt="csv", max_size=50)
+    writer.write("1", outdata, ["cps"])
+    state = writer.checkpoint()
+    for step in "234":
+        writer.write(step, outdata, ["cps"])
+    writer.close()
+    assert len(writer.paths) == 4
+
+    resumed = StatWriter(str(tmp_path), fmt="csv", max_size=50)
+    resumed.restore(state)
+    for step in "56":
+        resumed.write(step, outdata, ["cps"])
+    resumed.close()
+
+    rows = []
+    for path in sorted(os.listdir(tmp_path)):
+        with open(tmp_path / path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        assert lines[0].startswith("time,")
+        rows += [ line.split(",")[1] for line in lines[1:] ]
+    assert rows == [ "1", "5", "6" ]
+
+
+def test_resume_with_other_outdir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "cachedir", str(tmp_path / "cache"))
+    steps = """
+  - wait: 1s
+"""
+    playlist(tmp_path, steps, outdir=str(tmp_path / "a"))._save_checkpoint(1)
+    with pytest.raises(Exception) as e:
+        playlist(tmp_path, steps, outdir=str(tmp_path / "b"))._load_checkpoint()
+    assert "output directory" in str(e.value)
+    assert playlist(tmp_path, steps, outdir=str(tmp_path / "a"))._load_checkpoint()["pc"] == 1
+
+
+def test_parallel_timeout_cancels_polls(tmp_path, monkeypatch):
+    import threading
+    import time
+
+    from titanclient.api.client import APIClient
+
+    polls = []
+
+    def ready(self):
+        polls.append(threading.current_thread())
+        return False
+
+    monkeypatch.setattr(APIClient, "ready", ready)
+    p = playlist(tmp_path, """
+  - parallel:
+      timeout: 1
+      steps:
+        - ready:
+            titansim: ts1
+        - wait: 1h
+""", checkpoint=False)
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        p._execute(p._ops)
+    assert time.monotonic() - start < 10
+    n = len(polls)
+    time.sleep(1)
+    assert len(polls) == n
+    assert not any(t.is_alive() for t in polls)
+
+
+def test_clock_and_parallelism_bound_to_run(tmp_path):
+    virtual = playlist(tmp_path, """
+  - wait: 1s
+""", clock=VirtualClock(), parallelism=3)
+    assert _clock.virtual is False and _workers() is None
+
+    with virtual._bound():
+        assert _clock.virtual is True and _workers() == 3
+        # carried into the threads of the run, not into other threads
+        results = _map(lambda ts: (_clock.virtual, _workers()), ["ts1", "ts2"])
+        other = ThreadPoolExecutor(1).submit(lambda: (_clock.virtual, _workers())).result()
+    assert [ result for result, error, elapsed in results.values() ] == [ (True, 3), (True, 3) ]
+    assert other == (False, None)
+    assert _clock.virtual is False and _workers() is None
@@ -0,0 +1,193 @@
+import socket
+import asyncio
+import threading
+import http.client
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from titanclient.api.session import SessionPool, AsyncSessionPool, RetryPolicy, breakers
+
+
+URL = "http://192.0.2.1:8080/api.dsapi"
+
+
+class FailingAdapter(BaseAdapter):
+
+    def __init__(self, error):
+        super().__init__()
+        self.error = error
+        self.sent = 0
+
+    def send(self, request, **kwargs):
+        self.sent += 1
+        raise self.error
+
+    def close(self):
+        pass
+
+
+def refused():
+    reason = NewConnectionError(None, "Connection refused")
+    return requests.exceptions.ConnectionError(MaxRetryError(None, URL, reason))
+
+
+def disconnected():
+    reason = http.client.RemoteDisconnected("Remote end closed connection")
+    return requests.exceptions.ConnectionError(("Connection aborted.", reason))
+
+
+@pytest.fixture
+def pool():
+    pool = SessionPool(timeout=5, retry=RetryPolicy(retries=2, backoff=0))
+    breakers.reset_all()
+    yield pool
+    pool.unmount(URL)
+    breakers.reset_all()
+
+
+def test_breaker_counts_one_failure_per_request(pool):
+    adapter = FailingAdapter(refused())
+    pool.mount(URL, adapter)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        pool.get(URL)
+    assert adapter.sent == 3
+    assert breakers.stats(URL)["failures"] == 1
+    assert breakers.state(URL) == "closed"
+
+
+def test_write_retried_only_before_it_is_sent(pool):
+    adapter = FailingAdapter(disconnected())
+    pool.mount(URL, adapter)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        pool.post(URL, "{}", idempotent=False)
+    assert adapter.sent == 1
+
+    adapter = FailingAdapter(refused())
+    pool.mount(URL, adapter)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        pool.post(URL, "{}", idempotent=False)
+    assert adapter.sent == 3
+
+
+def test_read_retried_after_disconnect(pool):
+    adapter = FailingAdapter(disconnected())
+    pool.mount(URL, adapter)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        pool.post(URL, "{}")
+    assert adapter.sent == 3
+
+
+def test_single_attempt(pool):
+    adapter = FailingAdapter(refused())
+    pool.mount(URL, adapter)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        pool.get(URL, retry=RetryPolicy(retries=0))
+    assert adapter.sent == 1
+
+
+def test_timed_out_request_not_retried(pool):
+    adapter = FailingAdapter(requests.exceptions.ReadTimeout())
+    pool.mount(URL, adapter)
+    pool.timeout = 0
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        pool.get(URL)
+    assert adapter.sent == 1
+
+
+def server(connections):
+    """
+    Serve each item of `connections` on an accepted connection: the raw
+    responses to send, one per request, before closing it.
+    """
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen()
+    accepted = []
+
+    def serve():
+        for responses in connections:
+            conn, _ = sock.accept()
+            accepted.append(conn)
+            for response in responses:
+                conn.recv(65536)
+                conn.sendall(response)
+            conn.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    return "http://127.0.0.1:{}/api.dsapi".format(sock.getsockname()[1]), accepted
+
+
+@pytest.fixture
+def async_pool():
+    breakers.reset_all()
+    yield AsyncSessionPool(retry=RetryPolicy(retries=1, backoff=0))
+    breakers.reset_all()
+
+
+def test_async_connections_released_with_loop(async_pool):
+    # a truncated body
+    response = b"HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\nok"
+    url, _ = server([[response], [response]])
+    with pytest.raises(ConnectionError):
+        asyncio.run(async_pool.get(url))
+    assert not async_pool._idle and not async_pool._limits and not async_pool._closers
+
+
+def test_async_chunked_body(async_pool):
+    url, _ = server([[
+        b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+        b"3\r\n{\"a\r\n5;x=y\r\n\": 1}\r\n0\r\n\r\n"]])
+    response = asyncio.run(async_pool.get(url))
+    assert response.status_code == 200
+    assert response.text == '{"a": 1}'
+
+
+def test_async_body_without_length(async_pool):
+    url, accepted = server([
+        [b"HTTP/1.1 200 OK\r\n\r\nuntil close"],
+        [b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"]])
+
+    async def run():
+        first = await async_pool.get(url)
+        second = await async_pool.get(url)
+        return first.text, second.text
+
+    assert asyncio.run(run()) == ("until close", "ok")
+    assert len(accepted) == 2
+
+
+def test_async_reconnects_closed_idle_connection(async_pool):
+    ok = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"
+    # the server closes the first connection after one response
+    url, accepted = server([[ok], [ok]])
+
+    async def run():
+        await async_pool.get(url)
+        await asyncio.sleep(0.1)
+        return await async_pool.get(url)
+
+    assert asyncio.run(run()).text == "ok"
+    assert len(accepted) == 2
+
+
+def test_async_malformed_response_retried(async_pool):
+    ok = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"
+    url, accepted = server([
+        [b"garbage\r\n\r\n"],
+        [b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\nzz\r\n"],
+        [ok]])
+    with pytest.raises(ConnectionError):
+        asyncio.run(async_pool.get(url))
+    assert asyncio.run(async_pool.get(url)).text == "ok"
+    assert len(accepted) == 3
+
+
+def test_async_pool_across_loops(async_pool):
+    ok = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"
+    url, accepted = server([[ok], [ok]])
+    assert asyncio.run(async_pool.get(url)).text == "ok"
+    assert asyncio.run(async_pool.get(url)).text == "ok"
+    assert len(accepted) == 2
@@ -0,0 +1,57 @@
+import pytest
+
+from titanclient.api import playlist
+from titanclient.api.simulator import simulate
+
+
+SIMULATORS = """
+simulators:
+  - name: ts1
+    address: 192.0.2.1
+  - name: ts2
+    address: 192.0.2.2
+"""
+
+
+def write(tmp_path, steps):
+    path = tmp_path / "playlist.yaml"
+    path.write_text(SIMULATORS + "playlist:\n" + steps)
+    return str(path)
+
+
+def test_simulate_loop_on_virtual_clock(tmp_path):
+    report = simulate(write(tmp_path, """
+  - ready
+  - start
+  - set:
+      call_cps: 10
+      scenario: 0010PsPs_A
+  - label: loop
+  - wait: 1h
+  - stat:
+      name: call_total
+      table: false
+  - jumpif:
+      cond: all call_total < 100000
+      scenario: 0010PsPs_A
+      to: loop
+"""))
+    # 36000 calls an hour: the loop runs three times
+    assert 3 * 3600 <= report.duration < 4 * 3600
+    assert report.wall < 30
+    # start and set
+    for counts in report.requests.values():
+        assert counts["writes"] == 2
+    assert playlist._clock.virtual is False
+
+
+def test_simulate_parallel_timeout(tmp_path):
+    with pytest.raises(TimeoutError):
+        simulate(write(tmp_path, """
+  - parallel:
+      timeout: 60
+      steps:
+        - wait: 5m
+        - wait: 10s
+"""))
+    assert playlist._clock.virtual is False
@@ -0,0 +1,215 @@
+"""
+Asynchronous DsREST API client.
+
+`AsyncAPIClient` mirrors `titanclient.api.client.APIClient` with
+awaitable methods, so a single event loop can drive many TitanSims at
+once without a thread per host. Requests are composed by the same code
+as in the synchronous client: `defer=True` returns the `DsRequest` as-is,
+which can then be sent with either `DsRequest.send` or
+`DsRequest.send_async`.
+
+``` python
+>>> import asyncio
+>>> from titanclient.api.asyncclient import AsyncAPIClient, gather
+>>> clients = [AsyncAPIClient(ip) for ip in ["10.10.10.10", "10.10.10.11"]]
+>>> asyncio.run(gather(clients, "batch", "call_cps"))
+[{'0010PsPs_A': {'call_cps': 4.23156}, ... }, {'0010PsPs_A': { ... }}]
+```
+
+Scenario objects returned by `AsyncAPIClient.scenarios` expose the
+statistics and runtime value methods of `titanclient.api.client.Scenario`
+as coroutines:
+
+``` python
+>>> s = asyncio.run(client.get("0010PsPs_A"))
+>>> asyncio.run(s.call_success())
+83214
+```
+"""
+
+import asyncio
+from functools import wraps
+from contextlib import suppress
+
+from ..api.client import APIClient
+from ..api.dsrequest import deferable_async
+from ..api.discovery import discovery_cache
+from ..api.table import BatchTable
+from ..api.session import async_sessions
+
+
+def _mirror(name):
+    """
+    Return an awaitable version of the deferable `APIClient` method
+    `name`.
+    """
+    method = getattr(APIClient, name)
+
+    @deferable_async
+    @wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        await self._prefetch()
+        return method(self, *args, defer=True, **kwargs)
+
+    return wrapper
+
+
+class AsyncAPIClient(APIClient):
+
+    """
+    Asynchronous DsREST API client.
+    """
+
+    def __repr__(self):
+        return f"<AsyncAPIClient {self.ip}:{self.port}>"
+
+    async def ping(self):
+        """
+        Test DsREST API endpoint for availability
+        """
+        try:
+            resp = await async_sessions.get(self.url)
+            if resp and resp.status_code == 200:
+                return True
+        except (OSError, asyncio.TimeoutError):
+            return False
+
+    def connections(self):
+        """
+        Return request/hit/miss counters of the asyncio connections
+        shared by all awaited requests to this DsREST endpoint.
+        """
+        return async_sessions.stats(self.url)
+
+    def _fetch(self):
+        # discovery is awaited in _prefetch before any request is
+        # built; the synchronous hook used by the inherited request
+        # builders must not block the event loop.
+        pass
+
+    async def _prefetch(self):
+        if not self._fetched or len(self._scenarios) == 0 or self._expired():
+            await self.refresh()
+
+    async def refresh(self, force: bool = False):
+        """
+        Awaitable `APIClient.refresh`.
+        """
+        if force:
+            discovery_cache.clear(self.url)
+            self._fingerprint = None
+        steps = self._discover()
+        with suppress(StopIteration):
+            requests = next(steps)
+            while True:
+                requests = steps.send(await asyncio.gather(
+                    *[r.send_async() for r in requests]))
+        self._fetched = True
+
+    async def scenarios(self, name_filter: str = "", tag_filter: str = ""):
+        """
+        Awaitable `APIClient.scenarios`. Return a list of `AsyncScenario`
+        objects.
+        """
+        await self._prefetch()
+        return [AsyncScenario(s) for s in self._select(name_filter, tag_filter)]
+
+    async def group_of(self, scenario):
+        """
+        Return scenarios that belong to the same group as `scenario`.
+        """
+        await self._prefetch()
+        return [AsyncScenario(s) for s in self._scenarios if s.group == scenario.group]
+
+    async def get(self, name: str):
+        """
+        Return scenario with `name`. Exact match only.
+        """
+        await self._prefetch()
+        for s in self._scenarios:
+            if s.name == name:
+                return AsyncScenario(s)
+
+    async def table(self, stats, values=None, name_filter="", tag_filter=""):
+        """
+        Awaitable `APIClient.table`.
+        """
+        await self._prefetch()
+        stats_list = [ stats ] if isinstance(stats, str) else stats
+        request = self._batch(
+            stats_list,
+            values=values,
+            name_filter=name_filter,
+            tag_filter=tag_filter)
+        if not request:
+            return BatchTable([], stats_list, [])
+        return await request.send_async(table=True)
+
+    async def ready(self):
+        """
+        Return true if TitanSim is traffic-ready. Non-deferable.
+        """
+        try:
+            result = await self._ready().send_async()
+            return result[0]["ready"]
+        except (OSError, asyncio.TimeoutError):
+            return False
+
+    async def exit(self):
+        """
+        Exit TitanSim. *Non-deferrable.*
+        """
+        try:
+            await self._exit().send_async()
+        except (OSError, asyncio.TimeoutError):
+            pass
+
+    batch = _mirror("batch")
+    reset = _mirror("reset")
+    cps = _mirror("cps")
+    gos = _mirror("gos")
+    total = _mirror("total")
+    failed = _mirror("failed")
+    success = _mirror("success")
+    stats = _mirror("stats")
+    start_all = _mirror("start_all")
+    stop_all = _mirror("stop_all")
+
+
+class AsyncScenario:
+
+    """
+    Wrapper of `titanclient.api.client.Scenario` whose statistics and
+    runtime value methods are coroutines. Attributes such as `name`,
+    `group` or `tags` are passed through.
+    """
+
+    def __init__(self, scenario):
+        self.scenario = scenario
+        "Wrapped `Scenario` object"
+
+    def __repr__(self):
+        return f"<async scenario {self.scenario.name}>"
+
+    def __getattr__(self, name):
+        attr = getattr(self.scenario, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        @wraps(attr)
+        async def method(*args, defer=False, **kwargs):
+            request = attr(*args, defer=True, **kwargs)
+            return request if defer else await request.send_async()
+
+        return method
+
+
+async def gather(clients, method, *args, **kwargs):
+    """
+    Call coroutine `method` with `args`/`kwargs` on each client in
+    `clients` concurrently. Return the list of results in the order of
+    `clients`; a failed call returns its exception instead of raising.
+    """
+    return await asyncio.gather(
+        *[getattr(c, method)(*args, **kwargs) for c in clients],
+        return_exceptions=True)
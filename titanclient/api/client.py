@@ -1,6 +1,7 @@
 """ .. include:: ../../docs/api/client.md """
 
 import re
+import time
 from typing import Union
 from inspect import signature
 from contextlib import suppress
@@ -12,9 +13,28 @@ import tagexpressions
 
 from ..api.dsrequest import (
     DsRequest,
+    Timeline,
     deferable,
     only,
     helpers)
+from ..api.session import sessions, breakers
+from ..api.table import BatchDecoder, BatchTable
+from ..api.discovery import discovery_cache, fingerprint
+from ..common.config import settings
+
+
+def _entity_groups(resp):
+    """
+    Return [entity group, [scenario]] pairs of a fingerprint request
+    response. Only the first scenario of each entity group is used, as
+    in scenario discovery.
+    """
+    pairs = []
+    with suppress(Exception):
+        for eg in resp[0] or []:
+            scenarios = (eg.get("children") or [[]])[0] or []
+            pairs.append([eg["entity_group"], [s["scenario"] for s in scenarios[:1]]])
+    return pairs
 
 
 class APIClient:
@@ -26,7 +46,8 @@ class APIClient:
     def  __init__(
             self,
             ip: str,
-            port: int = 8080):
+            port: int = 8080,
+            discovery_ttl: int = None):
 
         self.ip = ip
         "DSRest API address"
@@ -34,9 +55,15 @@ class APIClient:
         "DsREST API port"
         self.url = f"http://{ip}:{port}/api.dsapi"
         "DsREST API endpoint URL"
+        self.discovery_ttl = settings.discovery_ttl if discovery_ttl is None else discovery_ttl
+        "Seconds before scenario data is checked for changes (0: never)"
 
         self._scenarios = []
         self._fetched = False
+        self._fingerprint = None
+        self._checked = None
+        self._templates = {}
+        self._template_limit = 64
 
     def __repr__(self):
         return f"<APIClient {self.ip}:{self.port}>"
@@ -46,16 +73,99 @@ class APIClient:
         Test DsREST API endpoint for availability
         """
         try:
-            resp = requests.get(self.url)
+            resp = sessions.get(self.url)
             if resp and resp.status_code == 200:
                 return True
         except:
             return False
 
+    def connections(self):
+        """
+        Return request/hit/miss counters of the keep-alive session
+        shared by all requests to this DsREST endpoint.
+        """
+        return sessions.stats(self.url)
+
+    def available(self):
+        """
+        Return false if the circuit breaker of the DsREST endpoint is
+        open, i.e. requests fail fast with
+        `titanclient.api.session.CircuitOpenError` without being sent.
+        """
+        return breakers.available(self.url)
+
     def _fetch(self):
         """
         Fetch scenario data and add Scenario objects into instance.
         """
+        steps = self._discover()
+        with suppress(StopIteration):
+            requests = next(steps)
+            while True:
+                requests = steps.send([r.send() for r in requests])
+
+    def refresh(self, force: bool = False):
+        """
+        Check whether the scenario set of TitanSim has changed and
+        reload scenario data if so. With `force`, drop cached discovery
+        results and reload unconditionally.
+        """
+        if force:
+            discovery_cache.clear(self.url)
+            self._fingerprint = None
+        self._fetch()
+        self._fetched = True
+
+    def _discover(self):
+        """
+        Generator of the scenario discovery steps used by `_fetch`.
+        Yields lists of requests and receives their responses, so that
+        they can be sent either synchronously or awaited.
+
+        Cached discovery results (see `titanclient.api.discovery`) are
+        used as-is within `discovery_ttl` seconds of the last check.
+        Otherwise only the scenario set fingerprint is requested, and
+        the full discovery is done only if no cached results match it.
+        """
+
+        if not self._fetched:
+            rows, checked = discovery_cache.current(self.url, self.discovery_ttl)
+            if rows is not None:
+                self._restore(rows, checked)
+                return
+
+        if self._scenarios or discovery_cache.fingerprints(self.url):
+            resp, = yield [ self._fingerprint_request() ]
+            fp = fingerprint(_entity_groups(resp))
+            if fp == self._fingerprint and self._scenarios:
+                self._checked = time.monotonic()
+                return
+            rows = discovery_cache.get(self.url, fp)
+            if rows is not None:
+                self._restore(rows)
+                return
+
+        self._load(*(yield list(self._discovery())))
+
+        if self._scenarios:
+            rows = [[s.entity_group, s.group, s.name, s.cases, s.tags] for s in self._scenarios]
+            discovery_cache.put(self.url, self._fingerprint, rows)
+
+    def _fingerprint_request(self):
+        """
+        Return the request listing entity groups and their scenarios,
+        used to tell whether the scenario set has changed.
+        """
+        eg = DsRequest("ExecCtrl", "EntityGroups", key="entity_group", url=self.url)
+        sc = DsRequest("ExecCtrl", "Scenarios", key="scenario")
+        sc.param("EntityGroup", 0)
+        return eg.child(sc)
+
+    def _discovery(self):
+        """
+        Return the scenario tag and scenario data requests used by
+        `_fetch`.
+        """
 
         # try to load any scenario tags
 
@@ -64,14 +174,6 @@ class APIClient:
         tags_child.param("tCIDx", "%Parent0::idx%")
         tags.child(tags_child)
 
-        resp = tags.send()
-
-        tags = {}
-
-        with suppress(Exception):
-            for tc in resp[0]:
-                tags[tc["tCName"]] = [t["tags"] for t in (tc["children"][0] or [])]
-
         # fetch scenario data
 
         eg = DsRequest("ExecCtrl", "EntityGroups", key="entity_group", url=self.url)
@@ -85,13 +187,27 @@ class APIClient:
         tc.param("Scenario", 1)
         eg.child(sc.child(tc).child(gr))
 
-        resp = eg.send()
+        return tags, eg
+
+    def _load(self, tags_resp, resp):
+        """
+        Add Scenario objects built from the responses to the
+        `_discovery` requests into instance.
+        """
+
+        tags = {}
+
+        with suppress(Exception):
+            for tc in tags_resp[0]:
+                tags[tc["tCName"]] = [t["tags"] for t in (tc["children"][0] or [])]
 
         if not resp[0:]:
             return
 
         # add scenarios to instance
 
+        scenarios = []
+
         for eg in resp[0]:
 
             entity_group = eg["entity_group"]
@@ -102,7 +218,7 @@ class APIClient:
             for tc in eg["children"][0][0]["children"][0]:
                 traffic_case.append(tc["traffic_case"])
 
-            self._scenarios.append(Scenario(
+            scenarios.append(Scenario(
                 entity_group,
                 group,
                 scenario,
@@ -110,6 +226,55 @@ class APIClient:
                 tags.get(scenario),
                 url=self.url))
 
+        self._set_scenarios(scenarios)
+
+    def _restore(self, rows, checked=None):
+        """
+        Add Scenario objects built from cached discovery results into
+        instance. `checked` is the time.time() the results were last
+        checked at, if not just now.
+        """
+        self._set_scenarios([Scenario(*row, url=self.url) for row in rows])
+        if checked is not None:
+            # the TTL runs from the check, not from loading the cache
+            self._checked = time.monotonic() - max(time.time() - checked, 0)
+
+    def _set_scenarios(self, scenarios):
+
+        # cached batch templates are only valid for the scenario list
+        # they were built for
+
+        def _identity(scenario_list):
+            return [(s.entity_group, s.group, s.name, s.cases, s.tags) for s in scenario_list]
+
+        if _identity(scenarios) != _identity(self._scenarios):
+            self._templates = {}
+
+        self._scenarios = scenarios
+        self._fingerprint = fingerprint([[s.entity_group, [s.name]] for s in scenarios])
+        self._checked = time.monotonic()
+
+
+    def _expired(self):
+        """
+        Return true if scenario data is older than `discovery_ttl`.
+        """
+        return bool(self.discovery_ttl) and self._checked is not None \
+            and time.monotonic() - self._checked > self.discovery_ttl
+
+    def prefetch(f):
+        """
+        @private
+        """
+        @wraps(f)
+        def wrapper(self, *args, **kwargs):
+            if not self._fetched or len(self._scenarios) == 0 or self._expired():
+                self._fetch()
+                self._fetched = True
+
+            return f(self, *args, **kwargs)
+
+        return wrapper
 
     @deferable
     def batch(self,
@@ -138,6 +303,10 @@ class APIClient:
         <__main__.DsRequest object at 0x7f81a7bd9908>
         ```
 
+        Requests without `values` are compiled (pre-serialized) once and
+        shared by subsequent calls with the same arguments, so deferred
+        requests shouldn't be modified.
+
         ⚠ NOTE: the `defer` argument is a sneaky presence: it's not shown in
         the individual function signatures, as it is handled by a
         decorator that removes it from the list of kwargs it passes to
@@ -161,8 +330,63 @@ class APIClient:
             name_filter=name_filter,
             tag_filter=tag_filter)
 
+    def table(self,
+              stats: Union[str, list],
+              values: dict = None,
+              name_filter: str = "",
+              tag_filter: str = ""):
+        """
+        Like `batch`, but return a `titanclient.api.table.BatchTable`
+        with one row per scenario and one column per stat, for
+        consumers that aggregate over scenarios:
+
+        ``` python
+        >>> t = client.table(["call_total", "call_cps"])
+        >>> sum(v for v in t.column("call_total") if v)
+        1531
+        >>> t.array().sum(axis=0)   # requires numpy
+        ```
 
+        Deferred `batch` requests return tables with
+        `send(table=True)`.
+        """
+        stats_list = [ stats ] if isinstance(stats, str) else stats
+        request = self._batch(
+            stats_list,
+            values=values,
+            name_filter=name_filter,
+            tag_filter=tag_filter)
+        if not request:
+            return BatchTable([], stats_list, [])
+        return request.send(table=True)
+
+    @prefetch
     def _batch(self, stats, values=None, name_filter="", tag_filter=""):
+        """
+        Return the batch request for `stats`. Read-only requests are
+        compiled once per stats and filters and reused until scenario
+        discovery finds a changed scenario list.
+        """
+
+        stats_list = [ stats ] if isinstance(stats, str) else stats
+
+        if values:
+            return self._build_batch(stats_list, values, name_filter, tag_filter)
+
+        key = (tuple(stats_list), name_filter, tag_filter)
+        template = self._templates.get(key)
+
+        if template is None:
+            template = self._build_batch(stats_list, None, name_filter, tag_filter)
+            if template:
+                template.compile()
+            if len(self._templates) >= self._template_limit:
+                del self._templates[next(iter(self._templates))]
+            self._templates[key] = template
+
+        return template
+
+    def _build_batch(self, stats_list, values, name_filter, tag_filter):
 
         def _merge_batch(response):
             data = {}
@@ -176,15 +400,18 @@ class APIClient:
                             data[name][stat] = value
             return data
 
-        stats_list = [ stats ] if isinstance(stats, str) else stats
-        scenarios = self.scenarios(
+        scenarios = self._select(
             name_filter=name_filter,
             tag_filter=tag_filter)
 
+        columns = {stat: i for i, stat in reversed(list(enumerate(stats_list)))}
+        fields = []
+
         main = None
         for s in scenarios:
             req = DsRequest("ExecCtrl", "Scenarios", url=self.url)
             req.param("EntityGroup", s.entity_group)
+            fields.append([])
             for stat in stats_list:
 
                 if not hasattr(s, stat):
@@ -205,6 +432,7 @@ class APIClient:
                     child.ptc(0)
 
                 req.child(child)
+                fields[-1].append((columns[stat], child._cast))
 
             if not main:
                 main = req
@@ -215,22 +443,46 @@ class APIClient:
         if main and not main.siblings:
             main.callback(_merge_batch)
 
+        if main:
+            main.decoder(BatchDecoder([s.name for s in scenarios], stats_list, fields))
+
         return main or {}
 
 
-    def prefetch(f):
-        """
-        @private
+    @prefetch
+    def timeline(self,
+                 stats: Union[str, list],
+                 period: int = 1,
+                 maxpoints: int = 60,
+                 name_filter: str = "",
+                 tag_filter: str = ""):
+        """
+        Return a `titanclient.api.dsrequest.Timeline` of `stats`
+        sampled by TitanSim every `period` seconds for scenarios
+        matched by `name_filter` or `tag_filter`. Each `poll` of the
+        timeline fetches all samples collected since the previous one
+        in a single request, keeping at most `maxpoints` samples per
+        stat on both ends.
+
+        ``` python
+        >>> t = client.timeline("call_cps", period=5)
+        >>> t.poll()
+        {'0010PsPs_A': {'call_cps': [(1690000000.0, 4.0), ...]}, ...}
+        ```
         """
-        @wraps(f)
-        def wrapper(self, *args, **kwargs):
-            if not self._fetched or len(self._scenarios) == 0:
-                self._fetch()
-                self._fetched = True
+        stats_list = [ stats ] if isinstance(stats, str) else stats
+        main = self._build_batch(stats_list, None, name_filter, tag_filter)
+        if not main:
+            return None
 
-            return f(self, *args, **kwargs)
+        main.decoder(None)
 
-        return wrapper
+        for req in [main] + main.siblings:
+            for child in req.request[req.method].get("children", []):
+                if child.request[child.method]["source"] != "DataSource":
+                    child.timeline(period, maxpoints)
+
+        return Timeline(main, size=maxpoints)
 
     @prefetch
     def scenarios(self,
@@ -261,7 +513,9 @@ class APIClient:
         *Tags have to be configured in the TTCN configuration used to
         launch the TitanSim execution being queried.*
         """
+        return self._select(name_filter, tag_filter)
 
+    def _select(self, name_filter="", tag_filter=""):
         sf = re.compile(name_filter) if name_filter else None
         tf = tagexpressions.parse(tag_filter) if tag_filter else None
 
@@ -293,8 +547,7 @@ class APIClient:
         """
         Return true if TitanSim is traffic-ready. Non-deferable.
         """
-        request = DsRequest("ExecCtrl", "ReadyToRun", url=self.url,
-                            key="ready").callback(cast=helpers.is_ready)
+        request = self._ready()
         try:
             result = request.send()
             return result[0]["ready"]
@@ -302,6 +555,10 @@ class APIClient:
                 requests.exceptions.ConnectionError):
             return False
 
+    def _ready(self):
+        return DsRequest("ExecCtrl", "ReadyToRun", url=self.url,
+                         key="ready").callback(cast=helpers.is_ready)
+
     def exit(self):
         """
         Exit TitanSim. After this call is issued, the simulator becomes
@@ -309,7 +566,7 @@ class APIClient:
 
         *Non-deferrable.*
         """
-        request = DsRequest("ExecCtrl", "Exit", method="set", value="1", tp=1, url=self.url)
+        request = self._exit()
         try:
             request.send()
         except (requests.exceptions.ConnectTimeout,
@@ -317,6 +574,9 @@ class APIClient:
                 requests.exceptions.ReadTimeout):
             pass
 
+    def _exit(self):
+        return DsRequest("ExecCtrl", "Exit", method="set", value="1", tp=1, url=self.url)
+
     @deferable
     def reset(self):
         """
@@ -632,6 +892,13 @@ class Scenario():
         """
         return self.__scen("ScGrpScStatus", cast=helpers.state)
 
+    @deferable
+    def status(self):
+        """
+        Return current (phase, state) of scenario in one request.
+        """
+        return self.__scen("ScGrpScStatus", cast=helpers.status)
+
     @deferable
     @only(["orig", "xcap"], any)
     def cps(self, value=None):
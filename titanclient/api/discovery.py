@@ -0,0 +1,147 @@
+"""
+On-disk cache of DsREST scenario discovery results.
+
+Scenario discovery (see `titanclient.api.client.APIClient.scenarios`)
+walks every entity group, scenario, traffic case, group and tag of a
+TitanSim execution, which is slow on large configurations. The results
+are stored per DsREST endpoint URL under the `cachedir` setting and keyed
+by a fingerprint of the scenario set, so that
+
+- new `APIClient` instances (e.g. subsequent CLI invocations) start
+  warm within `discovery_ttl` seconds of the last check, and
+
+- after the TTL, only a cheap fingerprint request is sent and the
+  full discovery is repeated only if the scenario set changed (e.g.
+  after TitanSim was relaunched with a different configuration).
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+from ..common.config import settings
+from ..common.logger import logger
+
+
+def fingerprint(entity_groups):
+    """
+    Return a hash of a list of (entity group, [scenario, ...]) pairs.
+    """
+    data = json.dumps(entity_groups, sort_keys=True)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+class DiscoveryCache:
+
+    """
+    Scenario discovery cache. Each endpoint has a file with the
+    scenario list for up to `entries` fingerprints and the fingerprint
+    found at the last check.
+    """
+
+    def __init__(self, cachedir=None, entries=8):
+        self.cachedir = cachedir
+        self.entries = entries
+
+    def __repr__(self):
+        return f"<DiscoveryCache {self._dir()}>"
+
+    def current(self, url, ttl):
+        """
+        Return the scenario list of `url` and the time it was last
+        checked if that was less than `ttl` seconds ago, or (None, None).
+        """
+        data = self._read(url)
+        fp = data.get("current")
+        if not fp or fp not in data["scenarios"] or not ttl:
+            return None, None
+        checked = data.get("checked", 0)
+        if time.time() - checked > ttl:
+            return None, None
+        return data["scenarios"][fp], checked
+
+    def latest(self, url):
+        """
+        Return the scenario list of `url` found at the last check,
+        regardless of its age, or None.
+        """
+        data = self._read(url)
+        return data["scenarios"].get(data.get("current") or "")
+
+    def fingerprints(self, url):
+        """
+        Return the fingerprints cached for `url`.
+        """
+        return list(self._read(url)["scenarios"].keys())
+
+    def get(self, url, fp):
+        """
+        Return the scenario list of `url` with fingerprint `fp` and
+        mark it as current, or return None.
+        """
+        data = self._read(url)
+        scenarios = data["scenarios"].get(fp)
+        if scenarios is not None:
+            data["current"] = fp
+            data["checked"] = time.time()
+            self._write(url, data)
+        return scenarios
+
+    def put(self, url, fp, scenarios):
+        """
+        Store `scenarios` (a list of [entity group, group, name, cases,
+        tags] lists) of `url` with fingerprint `fp` as current.
+        """
+        data = self._read(url)
+        data["scenarios"].pop(fp, None)
+        data["scenarios"][fp] = scenarios
+        while len(data["scenarios"]) > self.entries:
+            del data["scenarios"][next(iter(data["scenarios"]))]
+        data["current"] = fp
+        data["checked"] = time.time()
+        self._write(url, data)
+
+    def clear(self, url):
+        """
+        Remove cached scenario lists of `url`.
+        """
+        path = self._path(url)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _dir(self):
+        return os.path.join(os.path.expanduser(self.cachedir or settings.cachedir), "discovery")
+
+    def _path(self, url):
+        name = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self._dir(), name + ".json")
+
+    def _read(self, url):
+        path = self._path(url)
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            if data.get("url") == url:
+                return data
+        except (IOError, ValueError):
+            pass
+        return {"url": url, "current": None, "checked": 0, "scenarios": {}}
+
+    def _write(self, url, data):
+        path = self._path(url)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp, path)
+        except IOError as e:
+            logger.debug(f"couldn't write discovery cache {path}: {e}")
+
+
+discovery_cache = DiscoveryCache()
+"""
+Process-wide discovery cache used by `APIClient`.
+"""
@@ -13,11 +13,13 @@ DsREST API methods in `APIClient`.
 
 import re
 import json
-import requests
 import functools
+import collections
 
 from types import SimpleNamespace
 
+from ..api.session import sessions, async_sessions
+
 class DsRequest:
 
     """
@@ -38,6 +40,8 @@ class DsRequest:
         self._siblings_callback = lambda identity : identity
         self._post = lambda i: i
         self._silent = False
+        self._compiled = None
+        self._decoder = None
         if params:
             for k,v in params.items():
                 self.param(k,v)
@@ -59,6 +63,7 @@ class DsRequest:
             self.request[self.method]["children"] = [ request ]
         else:
             self.request[self.method]["children"].append(request)
+        self._compiled = None
         return self
 
     def sibling(self, req, siblings_callback=None):
@@ -70,6 +75,7 @@ class DsRequest:
         if siblings_callback:
             self._siblings_callback = siblings_callback
         self.siblings.append(req)
+        self._compiled = None
         return self
 
     def param(self, key, value):
@@ -90,6 +96,7 @@ class DsRequest:
            self.request[self.method]["params"][idx] = param
         else:
             self.request[self.method]["params"].append(param)
+        self._compiled = None
         return self
 
     def timeline(self, period, maxpoints, since=0):
@@ -98,13 +105,18 @@ class DsRequest:
         collected each `period` seconds, starting with `since`. A
         since=0 value means the timestamp for the request.
 
-        The values of the timeline must be queried in a separate
-        request. Subsequent requests should return the expanding list
-        of y/x values.
-
-
+        The value of a timeline request is a list of (x, y) tuples,
+        i.e. timestamp and (cast) value pairs, instead of a single
+        value. Subsequent requests return the expanding list of
+        samples; pass the last timestamp received as `since` (or use
+        `Timeline`) to fetch new samples only.
         """
-        raise NotImplementedError
+        self.request[self.method]["timeline"] = {
+            "period": period,
+            "maxpoints": maxpoints,
+            "since": since}
+        self._compiled = None
+        return self
 
     def callback(self, function=lambda i: i, cast=str):
         """
@@ -118,14 +130,37 @@ class DsRequest:
 
         return self
 
+    def decoder(self, decoder):
+        """
+        Decode responses with `decoder` (see
+        `titanclient.api.table.BatchDecoder`) instead of processing them
+        node by node and applying callbacks.
+        """
+        self._decoder = decoder
+        return self
+
     def ptc(self, ptcname):
         """
         Set the PTCname attribute for request.
         """
         self.request[self.method]["ptcname"] = ptcname if isinstance(ptcname, str) else "%Parent{}%".format(ptcname)
+        self._compiled = None
         return self
 
-    def send(self, url=None, timeout=0):
+    def compile(self, timeout=0):
+        """
+        Pre-serialize the request bundle for `timeout`. Subsequent
+        sends with the same `timeout` reuse the encoded payload instead
+        of re-encoding the request tree. `child`, `sibling`, `param` and
+        `ptc` discard the compiled payload; modifying child requests
+        after compilation doesn't.
+        """
+        self._compiled = None
+        reqlist, payload = self._bundle(timeout)
+        self._compiled = (timeout, reqlist, payload.encode("utf-8"))
+        return self
+
+    def send(self, url=None, timeout=0, table=False):
         """
         Send `DsRequest` to `url` with `timeout`. If `all` is true,
         sibling DsRequests are also sent and a list of values is
@@ -137,15 +172,45 @@ class DsRequest:
         it's possible to send the same `DsRequest` to the same address
         repeatedly or to different TitanSims depending on the `url`
         parameter.
+
+        Requests are sent on the keep-alive session shared by all
+        requests to the same endpoint (see `titanclient.api.session`).
+
+        With `table`, return the `titanclient.api.table.BatchTable` of
+        a request with a `decoder`.
         """
+        if table and not self._decoder:
+            raise ValueError("Only requests with a decoder can return tables.")
+        reqlist, payload = self._bundle(timeout)
+        response = sessions.post(url or self.url, payload, idempotent=_reads_only(payload))
+        return self._result(response.text, reqlist, table)
+
+    async def send_async(self, url=None, timeout=0, table=False):
+        """
+        Awaitable `send`. The request is sent on the asyncio connection
+        pool shared by all awaited requests to the same endpoint.
+        """
+        if table and not self._decoder:
+            raise ValueError("Only requests with a decoder can return tables.")
+        reqlist, payload = self._bundle(timeout)
+        response = await async_sessions.post(url or self.url, payload, idempotent=_reads_only(payload))
+        return self._result(response.text, reqlist, table)
+
+    def _bundle(self, timeout):
+        if self._compiled and self._compiled[0] == timeout:
+            return self._compiled[1:]
         siblings = self.siblings if all else []
         reqlist = []
         reqlist.append(self)
         reqlist = reqlist + siblings
         bundle = { "requests": reqlist, "timeOut": timeout }
-        payload = json.dumps(bundle, cls=self._Encode)
-        response = requests.post(url or self.url, data=payload, timeout=5)
-        content = json.loads(response.text)["contentList"]
+        return reqlist, json.dumps(bundle, cls=self._Encode)
+
+    def _result(self, text, reqlist, table=False):
+        content = json.loads(text)["contentList"]
+        if self._decoder and not self._silent:
+            decoded = self._decoder.decode(content)
+            return decoded if table else decoded.to_dict()
         result = self._process_response(content, reqlist)
         #print(result)
         if not self._silent:
@@ -167,12 +232,16 @@ class DsRequest:
                      for i, obj in enumerate(response) ]
         if isinstance(response, object):
             if response.get("node"):
-                try:
-                    value = response["node"].get("val", None)
-                    value = request._cast(value)
-                except ValueError:
-                    #print("couldn't cast value", value)
-                    value = None
+                timeline = response["node"].get("timeline")
+                if timeline is not None and request.request[request.method].get("timeline"):
+                    value = self._process_timeline(timeline, request)
+                else:
+                    try:
+                        value = response["node"].get("val", None)
+                        value = request._cast(value)
+                    except ValueError:
+                        #print("couldn't cast value", value)
+                        value = None
                 node_data = { request.key if request.key else request.request[request.method]["element"]: value}
                 resp_children = response["node"].get("childVals")
                 reqs_children = request.request[request.method].get("children", None)
@@ -183,6 +252,18 @@ class DsRequest:
             if response.get("list"):
                 return [ self._process_response(obj, request) for obj in response.get("list") ]
 
+    def _process_timeline(self, timeline, request):
+        if isinstance(timeline, str):
+            timeline = json.loads(timeline) if timeline else {}
+        samples = []
+        for x, y in zip(timeline.get("x", []), timeline.get("y", [])):
+            try:
+                y = request._cast(y)
+            except ValueError:
+                y = None
+            samples.append((float(x), y))
+        return samples
+
     def _json(self,timeout=5):
         """
         Return request bundle as JSON.
@@ -203,6 +284,124 @@ class DsRequest:
         def default(self, o):
             return o.__dict__["request"]
 
+class Timeline:
+
+    """
+    Incrementally fetched timeline with a client-side ring buffer of
+    at most `size` samples per stat.
+
+    `request` is a `DsRequest` with one or more timeline (child)
+    requests, such as the one returned by `APIClient.timeline`. Each
+    `poll` asks for samples newer than the last one received and
+    returns the new samples only, in the same shape as the response;
+    `values` returns the buffered samples.
+
+    ``` python
+    >>> t = client.timeline(["call_cps", "call_gos"], period=1, maxpoints=60)
+    >>> t.poll()
+    {'0010PsPs_A': {'call_cps': [(1690000000.0, 4.0), (1690000001.0, 4.2)], ...}}
+    >>> t.poll()
+    {'0010PsPs_A': {'call_cps': [(1690000002.0, 4.1)], ...}}
+    ```
+    """
+
+    def __init__(self, request, size=None):
+        self.request = request
+        "Timeline `DsRequest`"
+        nodes = list(_timeline_nodes(request))
+        self.size = size or max([n["maxpoints"] for n in nodes] or [0]) or None
+        "Ring buffer size per stat"
+        self.since = min([n["since"] for n in nodes] or [0])
+        "Timestamp of the oldest most recent sample across all stats"
+        self.buffers = {}
+        "Sample ring buffer for each response path"
+
+    def __repr__(self):
+        return f"<Timeline {self.request.url}>"
+
+    def poll(self):
+        """
+        Fetch and buffer samples newer than the last poll. Return the
+        new samples.
+        """
+        for node in _timeline_nodes(self.request):
+            node["since"] = self.since
+        self.request._compiled = None
+
+        new = _Samples()
+        for path, samples in _walk(self.request.send()):
+            buffer = self.buffers.get(path)
+            if buffer is None:
+                buffer = self.buffers[path] = collections.deque(maxlen=self.size)
+            last = buffer[-1][0] if buffer else None
+            fresh = [s for s in samples if last is None or s[0] > last]
+            buffer.extend(fresh)
+            new.set(path, fresh)
+
+        latest = [b[-1][0] for b in self.buffers.values() if b]
+        if latest:
+            self.since = min(latest)
+
+        return new.data
+
+    def values(self):
+        """
+        Return buffered samples in the shape of the response.
+        """
+        data = _Samples()
+        for path, buffer in self.buffers.items():
+            data.set(path, list(buffer))
+        return data.data
+
+
+class _Samples:
+
+    def __init__(self):
+        self.data = None
+
+    def set(self, path, samples):
+        if not path:
+            self.data = samples
+            return
+        if self.data is None:
+            self.data = {}
+        node = self.data
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+        node[path[-1]] = samples
+
+
+def _reads_only(payload):
+    """
+    Return true if the request bundle `payload` doesn't set any values.
+    """
+    return (b'"setData"' if isinstance(payload, bytes) else '"setData"') not in payload
+
+
+def _timeline_nodes(request):
+    """
+    Yield the timeline settings of `request`, its children and
+    siblings.
+    """
+    body = request.request[request.method]
+    if body.get("timeline"):
+        yield body["timeline"]
+    for child in body.get("children", []) + request.siblings:
+        yield from _timeline_nodes(child)
+
+
+def _walk(value, path=()):
+    """
+    Yield (path, samples) for each list of timeline samples in a
+    processed response.
+    """
+    if isinstance(value, dict):
+        for key, v in value.items():
+            yield from _walk(v, path + (key,))
+    elif isinstance(value, list) and all(isinstance(v, tuple) for v in value):
+        yield path, value
+
+
 class LED():
     """
     Parse and access LED string as an object
@@ -238,6 +437,23 @@ def deferable(f):
             return val
     return optionally_defer
 
+def deferable_async(f):
+    """
+    Asynchronous `deferable`. The decorated coroutine function returns
+    a DsRequest object; with `defer=True` it is returned as-is,
+    otherwise it is awaited with `DsRequest.send_async`.
+    """
+
+    @functools.wraps(f)
+    async def optionally_defer(self, *args, **kwargs):
+        defer = kwargs.get("defer", False)
+        if defer: del kwargs["defer"]
+        request = await f(self, *args, **kwargs)
+        if request:
+            val = request if defer else await request.send_async()
+            return val
+    return optionally_defer
+
 def only(conditions, operator=all):
 
     conditionals = {
@@ -287,6 +503,7 @@ helpers = SimpleNamespace(
     sec=__cast(lambda v: int(v.rstrip("s"))),
     phase=__cast(lambda v: StatusLED(v).phase),
     state=__cast(lambda v: StatusLED(v).state),
+    status=__cast(lambda v: (StatusLED(v).phase, StatusLED(v).state)),
     is_weighted=lambda v: v == "Weighted",
     is_running=lambda v: v == "Running",
     is_ready=lambda v: LED(v).status == "ReadyToRun")
@@ -0,0 +1,177 @@
+"""
+Fleet-level DsREST batch requests.
+
+`Fleet` sends the `APIClient.batch` bundles of many TitanSims
+concurrently and merges the responses into one result keyed by
+simulator, so the wall time of a fleet poll is bounded by the slowest
+simulator rather than the sum of all of them.
+
+``` python
+>>> from titanclient.api.fleet import Fleet
+>>> fleet = Fleet({"ts11": APIClient("10.10.10.11"), "ts12": APIClient("10.10.10.12")})
+>>> result = fleet.batch(["call_cps", "call_gos"])
+>>> result
+{'ts11': {'0010PsPs_A': {'call_cps': 4.2, 'call_gos': 99.8}, ...}, 'ts12': {...}}
+>>> result.latency
+{'ts11': 0.041, 'ts12': 0.058}
+>>> result.errors
+{}
+```
+
+Fleet batches can be deferred like any other batch and sent repeatedly:
+
+``` python
+>>> poll = fleet.batch("call_total", defer=True)
+>>> poll.send()
+{'ts11': {...}, 'ts12': {...}}
+```
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ..api.dsrequest import DsRequest
+
+
+class FleetResult(dict):
+
+    """
+    Merged `{sim: {scenario: {stat: value}}}` batch result. Simulators
+    that failed are left out of the mapping and reported in `errors`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latency = {}
+        "Round-trip time in seconds per simulator"
+        self.errors = {}
+        "Exception raised per failed simulator"
+        self.elapsed = 0.0
+        "Wall time of the whole fleet request in seconds"
+
+
+class Fleet:
+
+    """
+    Group of `APIClient` objects queried concurrently. `clients` is
+    either a dict of simulator name to client or a list of clients, in
+    which case each simulator is named by its "ip:port" address. At
+    most `max_workers` simulators are queried at a time (default: all
+    of them).
+    """
+
+    def __init__(self, clients, max_workers=None):
+        if isinstance(clients, dict):
+            self.clients = dict(clients)
+        else:
+            self.clients = {f"{c.ip}:{c.port}": c for c in clients}
+        self.max_workers = max_workers
+
+    def __repr__(self):
+        return f"<Fleet ({len(self.clients)})>"
+
+    def batch(self,
+              stats,
+              values=None,
+              name_filter="",
+              tag_filter="",
+              defer=False):
+        """
+        Return a `FleetResult` with the `APIClient.batch` response of
+        each simulator. `values` is a dict of simulator name to the
+        `values` argument of `APIClient.batch`.
+
+        With `defer=True`, return a `FleetBatch` that can be sent
+        repeatedly instead.
+        """
+
+        def _request(name):
+            return self.clients[name].batch(
+                stats,
+                values=(values or {}).get(name),
+                name_filter=name_filter,
+                tag_filter=tag_filter,
+                defer=True)
+
+        if defer:
+            requests = {}
+            for name, (request, error, _) in self._map(_request).items():
+                requests[name] = error or request
+            return FleetBatch(requests, self.max_workers, build=_request)
+
+        def _send(name):
+            request = _request(name)
+            return request.send() if isinstance(request, DsRequest) else {}
+
+        start = time.monotonic()
+        return _merge(self._map(_send), start)
+
+    def _map(self, func):
+        return _map(func, list(self.clients.keys()), self.max_workers)
+
+
+class FleetBatch:
+
+    """
+    Deferred fleet batch holding one `DsRequest` bundle per simulator.
+    If a simulator's request couldn't be built, `build` (called with
+    the simulator name) is retried on each `send` until it succeeds.
+    """
+
+    def __init__(self, requests, max_workers=None, build=None):
+        self.requests = requests
+        "Deferred batch request (or build error) per simulator"
+        self.max_workers = max_workers
+        self._build = build
+
+    def __repr__(self):
+        return f"<FleetBatch ({len(self.requests)})>"
+
+    def send(self, timeout=0):
+        """
+        Send all bundles concurrently and return a `FleetResult`.
+        """
+
+        def _send(name):
+            request = self.requests[name]
+            if isinstance(request, Exception):
+                if not self._build:
+                    raise request
+                request = self.requests[name] = self._build(name)
+            return request.send(timeout=timeout) if isinstance(request, DsRequest) else {}
+
+        start = time.monotonic()
+        return _merge(_map(_send, list(self.requests.keys()), self.max_workers), start)
+
+
+def _map(func, names, max_workers=None):
+    """
+    Call `func` on each name concurrently. Return a dict of name to
+    (result, exception, elapsed seconds).
+    """
+
+    def _timed(name):
+        start = time.monotonic()
+        try:
+            return name, func(name), None, time.monotonic() - start
+        except Exception as e:
+            return name, None, e, time.monotonic() - start
+
+    if not names:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(names)) as e:
+        return {name: (result, error, elapsed)
+                for name, result, error, elapsed in e.map(_timed, names)}
+
+
+def _merge(results, start):
+    merged = FleetResult()
+    for name, (result, error, elapsed) in results.items():
+        merged.latency[name] = elapsed
+        if error:
+            merged.errors[name] = error
+        else:
+            merged[name] = result
+    merged.elapsed = time.monotonic() - start
+    return merged
@@ -0,0 +1,216 @@
+"""
+Continuous runtime stats monitoring.
+
+`Monitor` polls a set of stats on one or more TitanSims at a fixed
+cadence using a deferred `titanclient.api.fleet.FleetBatch`. It keeps
+the samples in a bounded in-memory time series and reports only
+changed values. For counters such as `call_total`, it also reports
+the per-second rate computed from consecutive samples, so throughput
+doesn't have to be requested separately.
+
+``` python
+>>> from titanclient.api.monitor import Monitor
+>>> m = Monitor({"ts11": APIClient("10.10.10.11")}, ["call_total", "call_gos"], period=5)
+>>> m.sample()
+[{'time': 1690000000.1, 'sim': 'ts11', 'scenario': '0010PsPs_A', 'stat': 'call_total', 'value': 1200}, ...]
+>>> m.sample()
+[{'time': 1690000005.1, 'sim': 'ts11', 'scenario': '0010PsPs_A', 'stat': 'call_total', 'value': 1221, 'delta': 21, 'rate': 4.2}]
+>>> m.run(ndjson)
+```
+"""
+
+import sys
+import json
+import time
+import collections
+
+from prettytable import PrettyTable
+
+from ..api.fleet import Fleet
+
+COUNTERS = (
+    "total",
+    "success",
+    "failed",
+    "retry",
+    "sent",
+    "received",
+    "timeout",
+    "lost",
+    "duplicated",
+    "late",
+    "reordered",
+    "error",
+    "dropped",
+    "unknown")
+"""
+Stat name suffixes of monotonic counters, for which rates are derived
+"""
+
+
+def is_counter(stat):
+    """
+    Return true if `stat` is a monotonic counter.
+    """
+    return stat.split("_")[-1] in COUNTERS
+
+
+class Monitor:
+
+    """
+    Poll `stats` of the scenarios matched by `name_filter` and
+    `tag_filter` on `clients` (see `titanclient.api.fleet.Fleet`) every
+    `period` seconds, keeping at most `history` samples per simulator,
+    scenario and stat.
+    """
+
+    def __init__(self,
+                 clients,
+                 stats,
+                 period=5,
+                 history=60,
+                 name_filter="",
+                 tag_filter="",
+                 max_workers=None):
+
+        self.fleet = clients if isinstance(clients, Fleet) else Fleet(clients, max_workers)
+        self.stats = [ stats ] if isinstance(stats, str) else list(stats)
+        self.period = period
+        self.history = history
+        self.series = {}
+        "(timestamp, value) samples per (simulator, scenario, stat)"
+
+        self._filters = (name_filter, tag_filter)
+        self._batch = None
+
+    def __repr__(self):
+        return f"<Monitor {', '.join(self.stats)} ({len(self.fleet.clients)})>"
+
+    def sample(self):
+        """
+        Poll all simulators once. Return change records for values
+        that differ from the previous sample, plus error records for
+        simulators that couldn't be polled.
+        """
+        if not self._batch:
+            name_filter, tag_filter = self._filters
+            self._batch = self.fleet.batch(
+                self.stats,
+                name_filter=name_filter,
+                tag_filter=tag_filter,
+                defer=True)
+
+        result = self._batch.send()
+        now = time.time()
+        records = []
+
+        for sim, scenarios in result.items():
+            for scenario, values in scenarios.items():
+                for stat, value in values.items():
+                    record = self._record(now, sim, scenario, stat, value)
+                    if record:
+                        records.append(record)
+
+        for sim, error in result.errors.items():
+            records.append({"time": now, "sim": sim, "error": str(error)})
+
+        return records
+
+    def latest(self):
+        """
+        Return the most recent value and rate per (simulator, scenario,
+        stat).
+        """
+        latest = {}
+        for key, samples in self.series.items():
+            value = samples[-1][1] if samples else None
+            latest[key] = (value, self.rate(*key))
+        return latest
+
+    def rate(self, sim, scenario, stat):
+        """
+        Return the per-second rate of counter `stat` between its last
+        two samples, or None.
+        """
+        samples = self.series.get((sim, scenario, stat))
+        if not is_counter(stat) or not samples or len(samples) < 2:
+            return None
+        (t0, v0), (t1, v1) = samples[-2], samples[-1]
+        if v0 is None or v1 is None or v1 < v0 or t1 <= t0:
+            return None
+        return (v1 - v0) / (t1 - t0)
+
+    def run(self, emit, count=None):
+        """
+        Call `emit` with the records of each `sample` every `period`
+        seconds, `count` times or until interrupted. Sampling is
+        scheduled on absolute deadlines, so request latency doesn't
+        accumulate into drift.
+        """
+        deadline = time.monotonic()
+        n = 0
+        try:
+            while True:
+                emit(self, self.sample())
+                n += 1
+                if count is not None and n >= count:
+                    break
+                deadline += self.period
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    deadline = time.monotonic()
+        except KeyboardInterrupt:
+            pass
+
+    def _record(self, now, sim, scenario, stat, value):
+        key = (sim, scenario, stat)
+        samples = self.series.get(key)
+        if samples is None:
+            samples = self.series[key] = collections.deque(maxlen=self.history)
+        previous = samples[-1][1] if samples else None
+        first = not samples
+        samples.append((now, value))
+
+        if not first and value == previous:
+            return None
+
+        record = {"time": now, "sim": sim, "scenario": scenario, "stat": stat, "value": value}
+        if is_counter(stat) and not first:
+            record["delta"] = value - previous if None not in (value, previous) else None
+            record["rate"] = self.rate(*key)
+        return record
+
+
+def ndjson(monitor, records, file=sys.stdout):
+    """
+    `Monitor.run` emitter that writes each record as one line of JSON.
+    """
+    for record in records:
+        file.write(json.dumps(record) + "\n")
+    file.flush()
+
+
+def table(monitor, records, file=sys.stdout):
+    """
+    `Monitor.run` emitter that redraws a table of the latest values and
+    rates.
+    """
+    t = PrettyTable(["simulator", "scenario", "stat", "value", "rate/s"])
+    t.align["scenario"] = "l"
+    t.align["value"] = "r"
+    t.align["rate/s"] = "r"
+    for (sim, scenario, stat), (value, rate) in sorted(monitor.latest().items()):
+        t.add_row([
+            sim,
+            scenario,
+            stat,
+            "" if value is None else value,
+            "" if rate is None else f"{rate:.2f}"])
+    file.write("\033[2J\033[H")
+    file.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')}\n{t}\n")
+    for record in records:
+        if "error" in record:
+            file.write(f"{record['sim']}: {record['error']}\n")
+    file.flush()
@@ -1,18 +1,81 @@
 """ .. include:: ../../docs/api/playlist.md """
+import io
 import os
 import re
+import csv
 import sys
+import json
 import time
 import yaml
+import hashlib
+import logging
 import argparse
 import datetime
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait
 
+import requests
 from prettytable import PrettyTable
 
 from ..api.client import APIClient
+from ..api.fleet import _map as _fleet_map
+from ..api.session import sessions, RetryPolicy
+from ..common.config import settings
 from ..common.logger import logger
 
 padding = 0
+_local = threading.local()
+
+class _RealClock:
+
+    virtual = False
+
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, secs, cancel=None):
+        if cancel:
+            cancel.wait(secs)
+        else:
+            time.sleep(secs)
+
+    def fork(self):
+        return None
+
+    def enter(self, now):
+        pass
+
+    def leave(self):
+        return None
+
+    def join(self, ends):
+        pass
+
+    def record(self, op):
+        pass
+
+class _ThreadClock:
+
+    """
+    Clock of the playlist run by the calling thread (see
+    `Playlist.run`), or the system clock outside of a run.
+    """
+
+    def __getattr__(self, name):
+        return getattr(getattr(_local, "clock", None) or _system_clock, name)
+
+_system_clock = _RealClock()
+_clock = _ThreadClock()
+
+def _workers():
+    """
+    Return the parallelism of the playlist run by the calling thread.
+    """
+    return getattr(_local, "workers", None)
 
 class Playlist:
 
@@ -21,28 +84,108 @@ class Playlist:
     defined in YAML format. If `outdir` is defined and the playlist
     contains stats operations, save stats data to the designated
     directory.
+
+    Steps are compiled and validated when the playlist is created,
+    without contacting any simulator. Simulators are connected to in a
+    single concurrent preflight when the playlist is run.
+
+    Stats are saved as one YAML file per `stat` step by default. With
+    an `output` section in the playlist (see `StatWriter`), they are
+    appended to a CSV or NDJSON time series per run instead.
+
+    With `checkpoint`, the position in the playlist, the simulator
+    defaults and the stats output offsets are saved after each step,
+    and a run with `resume` continues after the last completed step of
+    an interrupted run of the same playlist.
     """
 
-    def __init__(self, filepath, outdir=None, dry_run=False):
+    def __init__(self, filepath, outdir=None, dry_run=False, parallelism=None, clock=None,
+                 checkpoint=True, resume=False):
         self.playlist_path = os.path.abspath(filepath)
-        self.playlist = yaml.safe_load(open(filepath, "r"))
+        with open(filepath, "rb") as f:
+            content = f.read()
+        self.playlist = yaml.safe_load(content)
         self.dry_run = dry_run
         self.outdir = outdir if outdir else None
+        self.checkpoint = checkpoint
+        self.resume = resume
+        self._hash = hashlib.sha1(content).hexdigest()
+        self.clock = clock
+        "Clock the playlist is run on (default: system clock)"
+        self.parallelism = parallelism or self.playlist.get("parallelism")
+        "Maximum number of simulators sent requests at a time"
         sims = self.playlist.get("simulators", [])
         steps = self.playlist.get("playlist", [])
         self._ops = []
-        self._pool = []
+        self._pool = {}
+        self._connected = False
+        self._writer = None
         if sims:
-            self._pool = _connect_sims(sims)
+            self._pool = _create_clients(sims)
             if steps:
                 global padding
                 padding = len(str(len(steps)))
-                self._ops = self._create_ops(steps, self._pool)
+                self._ops = self.compile(steps)
+                self._writer = self._create_writer(self.playlist.get("output"))
+                for op in list(self._ops) + list(_nested(self._ops)):
+                    if isinstance(op, Stat):
+                        op.writer = self._writer
+
+    def compile(self, steps):
+        """
+        Create and validate the operations of playlist `steps`. Raise an
+        exception listing all invalid steps.
+        """
+        ops, errors = self._create_ops(steps, self._pool)
+
+        labels = [ op.label for op in ops if isinstance(op, Label) ]
+        errors += [ "{}: {} not allowed in parallel block".format(op.index, type(op).__name__.lower())
+                    for op in _nested(ops) if isinstance(op, (Label, Jump, JumpIf)) ]
+        for op in ops:
+            jump_to = getattr(op, "jump_to", None)
+            if isinstance(op, (Jump, JumpIf)) and jump_to not in labels:
+                errors.append("{}: unknown label {}".format(op.idx.strip(), jump_to))
+            if isinstance(op, Op):
+                errors += [ "{}: {}".format(op.idx.strip(), e) for e in op.validate() ]
+            elif isinstance(op, Parallel):
+                errors += op.validate()
+
+        if errors:
+            errors.sort(key=lambda e: [ int(n) if n.isdigit() else 0 for n in e.split(":")[0].split(".") ])
+            raise Exception("Invalid playlist {}:\n{}".format(self.playlist_path, "\n".join(errors)))
+
+        return ops
+
+    def preflight(self):
+        """
+        Connect to all simulators concurrently and fetch the default
+        values used by `set` steps. Done once, before the first run.
+        """
+        if not self._connected:
+            with self._bound():
+                _connect_sims(self._pool)
+            self._connected = True
+
+    @contextmanager
+    def _bound(self):
+        # the clock and parallelism are bound to the running thread (and
+        # carried into the threads it starts), so that playlists run at
+        # the same time, e.g. a simulation, don't share them
+        saved = getattr(_local, "clock", None), getattr(_local, "workers", None)
+        _local.clock, _local.workers = self.clock, self.parallelism
+        try:
+            yield
+        finally:
+            _local.clock, _local.workers = saved
 
     def run(self):
         """
         Execute playlist.
         """
+        with self._bound():
+            self._run()
+
+    def _run(self):
         sims = self.playlist.get("simulators", [])
         steps = self.playlist.get("playlist", [])
         global padding
@@ -54,85 +197,289 @@ class Playlist:
         if not self._ops:
             raise Exception("Playlist contains no steps.")
 
+        self.preflight()
+
         is_dry_run = self.dry_run
         # in any case, print the Playlist contents at the top
 
         self.dry_run = True
-        logger.info("{} playlist {}".format(_pad, self.playlist_path))
+        _log("{} playlist {}".format(_pad, self.playlist_path))
 
         self._execute(self._ops)
-        logger.info("{} (end printout)\n\n".format(_pad))
+        _log("{} (end printout)\n\n".format(_pad))
 
         if not is_dry_run:
             self.dry_run = False
-            logger.info("{} START".format(_pad))
-            self._execute(self._ops)
-            logger.info("{} FINISH".format(_pad))
-
-    def _execute(self, ops):
+            pc = 0
+            if self.resume:
+                pc = self._restore(self._load_checkpoint())
+                _log("{} RESUME {}".format(_pad, self._ops[pc].idx.strip() if pc < len(self._ops) else "end"))
+            else:
+                _log("{} START".format(_pad))
+            try:
+                self._execute(self._ops, pc)
+            finally:
+                if self._writer:
+                    self._writer.close()
+            self._clear_checkpoint()
+            _log("{} FINISH".format(_pad))
+
+    def checkpoint_path(self):
+        """
+        Return the path of the checkpoint file of this playlist.
+        """
+        name = hashlib.sha1(self.playlist_path.encode("utf-8")).hexdigest()
+        return os.path.join(os.path.expanduser(settings.cachedir), "playlist", name + ".json")
+
+    def _save_checkpoint(self, pc):
+        data = {
+            "playlist": self.playlist_path,
+            "hash": self._hash,
+            "pc": pc,
+            "time": time.time(),
+            "outdir": os.path.abspath(self.outdir) if self.outdir else None,
+            "defaults": { ts: sim.get("default") for ts, sim in self._pool.items() },
+            "output": self._writer.checkpoint() if self._writer else None }
+        path = self.checkpoint_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def _load_checkpoint(self):
+        path = self.checkpoint_path()
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            raise Exception("No checkpoint to resume playlist {} from".format(self.playlist_path))
+        if data.get("hash") != self._hash:
+            raise Exception("Playlist {} changed since its checkpoint was saved".format(self.playlist_path))
+        outdir = os.path.abspath(self.outdir) if self.outdir else None
+        if data.get("outdir") != outdir:
+            raise Exception("Playlist {} was run with output directory {}, not {}".format(
+                self.playlist_path, data.get("outdir"), outdir))
+        return data
+
+    def _restore(self, data):
+        for ts, default in (data.get("defaults") or {}).items():
+            if ts in self._pool:
+                self._pool[ts]["default"] = default
+        if self._writer and data.get("output"):
+            self._writer.restore(data["output"])
+        return data["pc"]
+
+    def _clear_checkpoint(self):
+        if self.checkpoint and os.path.exists(self.checkpoint_path()):
+            os.remove(self.checkpoint_path())
+
+    def _create_writer(self, output):
+        if not output or not self.outdir:
+            return None
+        output = { "format": output } if isinstance(output, str) else output
+        if output.get("format", "yaml") == "yaml":
+            return None
+        return StatWriter(
+            self.outdir,
+            fmt=output.get("format"),
+            max_size=_parse_size(output.get("max_size", "100M")),
+            flush_interval=output.get("flush", 10))
+
+    def _execute(self, ops, pc=0):
         label_idx = {}
         for i, op in enumerate(ops):
             if isinstance(op, Label):
                 label_idx[op.label] = i + 1
-        pc = 0
         if self.dry_run:
             [op.exec(dry_run=self.dry_run) for op in ops]
         else:
             while pc < len(ops):
                 op = ops[pc]
+                _clock.record(op)
                 result = op.exec(dry_run=self.dry_run)
                 pc = label_idx[result] if result else pc + 1
+                if self.checkpoint:
+                    self._save_checkpoint(pc)
 
     def _create_ops(self, steps, pool):
         ops = []
+        errors = []
         for i, step in enumerate(steps, 1):
-            op = list(step.keys())[0] if isinstance(step, dict) else step
-            args = step[op] if isinstance(step, dict) else {}
-            if op == "set":
-                ops.append(Set(args, pool, index=i))
-            elif op == "label":
-                ops.append(Label(args, index=i))
-                i -= 1
-            elif op == "jump":
-                ops.append(Jump(args, index=i))
-            elif op == "jumpif":
-                ops.append(JumpIf(args, pool, index=i))
-            elif op == "stat":
-                ops.append(Stat(args, pool, self.outdir, index=i))
-            elif op == "ready":
-                ops.append(Ready(args, pool, index=i))
-            elif op == "wait":
-                ops.append(Wait(args, pool, index=i))
-            elif op == "start":
-                ops.append(Start(args, pool, index=i))
-            elif op == "stop":
-                ops.append(Stop(args, pool, index=i))
-            elif op == "reset":
-                ops.append(Reset(args, pool, index=i))
-            elif op == "exit":
-                ops.append(Exit(args, pool, index=i))
-            else:
-                raise Exception("Unhandled operation:", op)
-        return ops
+            try:
+                ops.append(self._create_op(step, pool, i))
+            except Exception as e:
+                errors.append("{}: {}".format(i, " ".join(map(str, e.args))))
+        return ops, errors
+
+    def _create_op(self, step, pool, i):
+        op = list(step.keys())[0] if isinstance(step, dict) else step
+        args = step[op] if isinstance(step, dict) else {}
+        if op == "set":
+            return Set(args, pool, index=i)
+        elif op == "label":
+            return Label(args, index=i)
+        elif op == "jump":
+            return Jump(args, index=i)
+        elif op == "jumpif":
+            return JumpIf(args, pool, index=i)
+        elif op == "stat":
+            return Stat(args, pool, self.outdir, index=i)
+        elif op == "ready":
+            return Ready(args, pool, index=i)
+        elif op == "wait":
+            return Wait(args, pool, index=i)
+        elif op == "at":
+            return At(args, pool, index=i)
+        elif op == "every":
+            return Every(args, pool, index=i)
+        elif op == "start":
+            return Start(args, pool, index=i)
+        elif op == "stop":
+            return Stop(args, pool, index=i)
+        elif op == "reset":
+            return Reset(args, pool, index=i)
+        elif op == "exit":
+            return Exit(args, pool, index=i)
+        elif op == "ramp":
+            return Ramp(args, pool, index=i)
+        elif op == "hold":
+            return Hold(args, pool, index=i)
+        elif op == "parallel":
+            return Parallel(args, lambda step, j: self._create_op(step, pool, j), index=i)
+        else:
+            raise Exception("Unhandled operation:", op)
 
 # HELPERS
 
-def _connect_sims(sims):
+def _log(message, level=logging.INFO):
+    """
+    Log `message`, or buffer it if called from a parallel block branch
+    so that branch logs can be written in order when the block joins.
+    """
+    buffer = getattr(_local, "buffer", None)
+    if buffer is not None:
+        buffer.append((level, message))
+    else:
+        logger.log(level, message)
+
+def _sleep(secs):
+    # in a parallel block branch, stop sleeping when the block times out
+    _clock.sleep(secs, getattr(_local, "cancel", None))
+
+def _cancelled():
+    """
+    Return true if the calling parallel block branch timed out, in
+    which case it should stop polling and sending requests.
+    """
+    cancel = getattr(_local, "cancel", None)
+    return bool(cancel and cancel.is_set())
+
+def _map(func, names, max_workers=None):
+    """
+    `titanclient.api.fleet._map` with the calling thread's playlist
+    clock and time, parallelism, log buffer and cancellation carried
+    into each call, and the time joined afterwards.
+    """
+    start = _clock.fork()
+    ends = []
+    buffer = getattr(_local, "buffer", None)
+    cancel = getattr(_local, "cancel", None)
+    clock = getattr(_local, "clock", None)
+    workers = _workers()
+
+    def _call(name):
+        _local.clock = clock
+        _local.workers = workers
+        _clock.enter(start)
+        _local.buffer = buffer
+        _local.cancel = cancel
+        try:
+            return func(name)
+        finally:
+            _local.buffer = None
+            _local.cancel = None
+            ends.append(_clock.leave())
+            _local.clock = None
+            _local.workers = None
+
+    results = _fleet_map(_call, names, max_workers)
+    _clock.join(ends)
+    return results
+
+def _sleep_until(deadline):
+    """
+    Sleep until `_clock.monotonic()` reaches `deadline`, or until the
+    parallel block branch is cancelled.
+    """
+    while True:
+        remaining = deadline - _clock.monotonic()
+        cancel = getattr(_local, "cancel", None)
+        if remaining <= 0 or (cancel and cancel.is_set()):
+            return
+        _sleep(remaining)
+
+def _nested(ops):
+    for op in ops:
+        if isinstance(op, Parallel):
+            for branch in op.branches:
+                yield from branch
+                yield from _nested(branch)
+
+def _create_clients(sims):
     pool = {}
     for sim in sims:
         address = sim.get("address")
         port = sim.get("port", 8080)
-        client = APIClient(address, port)
-        try:
-            default = client.batch(["call_cps", "message_cps", "cps", "rps"])
-        except Exception:
-            raise ConnectionError("Couldn't connect to TitanSim at {}:{}".format(address, port))
         pool[sim["name"]] = {
-            "default": default,
-            "client": client
+            "default": None,
+            "client": APIClient(address, port)
         }
     return pool
 
+def _connect_sims(pool, max_workers=16):
+    """
+    Check that all simulators of `pool` are reachable, then fetch the
+    defaults used by `set` steps (which also discovers their
+    scenarios). Both are done concurrently, at most `parallelism` (or
+    `max_workers`) simulators at a time, and the latency of each
+    simulator is logged. Raise ConnectionError listing every
+    unreachable simulator before any scenario discovery is started.
+    """
+    names = list(pool.keys())
+    limit = _workers() or min(len(names), max_workers)
+    _pad = " " * (padding + 2)
+
+    def _probe(ts):
+        # any HTTP response will do, only connection errors count; a
+        # single attempt, so that unreachable simulators fail fast
+        sessions.get(pool[ts]["client"].url, retry=RetryPolicy(retries=0))
+
+    def _connect(ts):
+        pool[ts]["default"] = pool[ts]["client"].batch(["call_cps", "message_cps", "cps", "rps"])
+
+    def _address(ts):
+        return "{} ({}:{})".format(ts, pool[ts]["client"].ip, pool[ts]["client"].port)
+
+    _log("{} CONNECT {}".format(" " * (padding + 1), ", ".join(names)))
+    failed = []
+    latency = {}
+    for ts, (result, error, elapsed) in _map(_probe, names, limit).items():
+        if error:
+            failed.append("{}: {}".format(_address(ts), error))
+        latency[ts] = elapsed
+    if failed:
+        raise ConnectionError("Couldn't connect to TitanSim:\n{}".format("\n".join(failed)))
+
+    for ts, (result, error, elapsed) in _map(_connect, names, limit).items():
+        if error:
+            failed.append("{}: {}".format(_address(ts), error))
+            continue
+        _log("{}{}: connect {:.0f} ms, defaults {:.0f} ms ({} scen.)".format(
+            _pad, ts, latency[ts] * 1000, elapsed * 1000, len(pool[ts]["default"] or {})))
+    if failed:
+        raise ConnectionError("Couldn't fetch defaults from TitanSim:\n{}".format("\n".join(failed)))
+
 def _select_titansims(args, pool):
     try:
         if isinstance(args, str) or (not args.get("titansim") or args.get("titansim") == "all"):
@@ -142,30 +489,234 @@ def _select_titansims(args, pool):
     except Exception:
         raise Exception("Simulator not found:", args.get("titansim"))
 
-def _poll(titansims, phase, state, timeout=300, scenario_filter=""):
-    phase_ready = phase == "ready"
-    ts_status = { ts: False for ts in titansims.keys() }
-    ts_client = { ts: settings.get("client") for ts, settings in titansims.items() }
-    expected_values = { "phase": phase, "state": state }
-    value_names = list(expected_values.keys())
-    start = time.time()
-    while time.time() < start + timeout:
-        for name, client in ts_client.items():
-            if not ts_status[name]:
-                result = client.ready() if phase_ready else client.batch(value_names, scenario_filter=scenario_filter)
-                if not phase_ready:
-                    # TODO: handle cases where the scenario has
-                    # already gone beyond the expected phase/state
-                    bool_list = []
-                    for s in result.keys():
-                        for v in value_names:
-                            bool_list.append(result[s].get(v, "").lower() == expected_values[v])
-                    result = all(bool_list)
-                if result:
-                    ts_status[name] = True
-        if all([ status for ts, status in ts_status.items() ]):
-            return
-        time.sleep(5)
+def _poll(titansims, phase, state, timeout=300, scenario_filter="",
+          interval=0.2, max_interval=5, backoff=1.5):
+    """
+    Wait until the scenarios matched by `scenario_filter` are in
+    `phase`/`state` (or until TitanSim is traffic-ready for the "ready"
+    phase) on all `titansims`. Simulators are polled concurrently, first
+    every `interval` seconds and then backing off by `backoff` up to
+    `max_interval`, and each one stops being polled as soon as it gets
+    there. Return the names of simulators that timed out, or all of
+    them if the parallel block branch polling them timed out.
+    """
+    deadline = _clock.monotonic() + timeout
+
+    def _arrived(client):
+        if phase == "ready":
+            return client.ready()
+        result = client.batch("status", name_filter=scenario_filter)
+        return all([ _status_is(values.get("status"), phase, state) for values in result.values() ])
+
+    def _wait(name):
+        client = titansims[name].get("client")
+        delay = interval
+        while not _cancelled():
+            try:
+                if _arrived(client):
+                    return True
+            except requests.exceptions.RequestException as e:
+                logger.debug("poll {}: {}".format(name, e))
+            remaining = deadline - _clock.monotonic()
+            if remaining <= 0:
+                return False
+            _sleep(min(delay, remaining))
+            delay = min(delay * backoff, max_interval)
+        return False
+
+    pending = []
+    for name, (arrived, error, elapsed) in _map(_wait, list(titansims.keys())).items():
+        if error:
+            raise error
+        if not arrived:
+            pending.append(name)
+        else:
+            logger.debug("{} reached {}/{} in {:.1f}s".format(name, phase, state, elapsed))
+
+    if pending:
+        _log("Timed out waiting for {}/{} on {}".format(phase, state, ", ".join(pending)), logging.WARNING)
+
+    return pending
+
+def _status_is(status, phase, state):
+    # TODO: handle cases where the scenario has already gone beyond
+    # the expected phase/state
+    if not status or None in status:
+        return False
+    return status[0].lower() == phase and status[1].lower() == state
+
+def _parse_time(string):
+    time_rx = re.compile(r"^(\d+)(s|m|h|d)?$")
+    is_time = time_rx.match(string)
+    if is_time:
+        time, unit = is_time.groups()
+        multiplier = 1
+        name = "second{}".format("s" if multiplier == 1 else "")
+        if unit == "m":
+            name = "minute{}".format("s" if multiplier == 1 else "")
+            multiplier = 60
+        if unit == "h":
+            name = "hour{}".format("s" if multiplier == 1 else "")
+            multiplier = 3600
+        if unit == "d":
+            name = "day{}".format("s" if multiplier == 1 else "")
+            multiplier = 86400
+        return int(time) * multiplier, time, name
+    else:
+        raise Exception("Couldn't parse time operand", string)
+
+def _seconds(value):
+    return value if isinstance(value, (int, float)) else _parse_time(str(value))[0]
+
+def _parse_size(value):
+    size_rx = re.compile(r"^(\d+)\s*([kKmMgG])?$")
+    size = size_rx.match(str(value))
+    if not size:
+        raise Exception("Couldn't parse size", value)
+    number, unit = size.groups()
+    return int(number) * { None: 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3 }[unit and unit.lower()]
+
+class StatWriter:
+
+    """
+    Append-only stats time series of a playlist run in `outdir`, in CSV
+    (one time, step, simulator, scenario, stat, value row per value) or
+    NDJSON (one object per simulator and scenario) format.
+
+    The output file is kept open and written through a buffer that is
+    flushed every `flush_interval` seconds by a background thread. Once
+    `max_size` bytes have been written to it, the file is closed and the
+    next numbered file is started:
+
+    ```
+    output:
+      format: csv       # csv, ndjson or yaml (default)
+      max_size: 100M    # rotate size, bytes or with k/M/G suffix
+      flush: 10         # seconds
+    ```
+    """
+
+    def __init__(self, outdir, fmt="ndjson", max_size=100 * 1024 ** 2, flush_interval=10):
+        if fmt not in ["csv", "ndjson"]:
+            raise Exception("Unknown output format:", fmt)
+        self.outdir = os.path.abspath(outdir)
+        self.fmt = fmt
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.paths = []
+        "Files written so far"
+        self._name = "stats_{}".format(datetime.datetime.now().strftime('%Y-%m-%d_%H:%M:%S'))
+        self._file = None
+        self._size = 0
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._flusher = None
+
+    def __repr__(self):
+        return "<StatWriter {}>".format(self.paths[-1] if self.paths else self.outdir)
+
+    def write(self, step, outdata, stats):
+        """
+        Append `stats` of `outdata` (as returned by `APIClient.batch`
+        per simulator) sampled by step `step`.
+        """
+        now = _clock.time()
+        lines = []
+        for ts, scenarios in outdata.items():
+            for scenario, values in scenarios.items():
+                if self.fmt == "csv":
+                    for stat in stats:
+                        if stat in values:
+                            lines.append(_csv_row([ now, step, ts, scenario, stat, values[stat] ]))
+                else:
+                    record = { "time": now, "step": step, "simulator": ts, "scenario": scenario }
+                    record.update({ stat: values[stat] for stat in stats if stat in values })
+                    lines.append(json.dumps(record) + "\n")
+        data = "".join(lines).encode("utf-8")
+
+        with self._lock:
+            if self._file is None or self._size >= self.max_size:
+                self._rotate()
+            self._file.write(data)
+            self._size += len(data)
+
+    def checkpoint(self):
+        """
+        Flush the current file and return the state to `restore` a
+        writer from.
+        """
+        with self._lock:
+            if self._file:
+                self._file.flush()
+            return { "name": self._name, "paths": list(self.paths), "size": self._size if self._file else None }
+
+    def restore(self, state):
+        """
+        Continue the files of the writer `state` was saved from. Values
+        written after the state was saved are discarded.
+        """
+        with self._lock:
+            self._name = state["name"]
+            self.paths = list(state["paths"])
+            n = len(self.paths)
+            while os.path.exists(self._path(n)):
+                # rotated into after the state was saved
+                os.unlink(self._path(n))
+                n += 1
+            path = self.paths[-1] if self.paths else None
+            if state.get("size") is None or not path or not os.path.exists(path):
+                return
+            os.truncate(path, state["size"])
+            self._file = open(path, "ab", buffering=65536)
+            self._size = state["size"]
+            self._start_flusher()
+
+    def close(self):
+        """
+        Flush and close the current file.
+        """
+        self._closed.set()
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def _flush(self):
+        while not self._closed.wait(self.flush_interval):
+            with self._lock:
+                if self._file:
+                    self._file.flush()
+
+    def _start_flusher(self):
+        if self._closed.is_set():
+            # reopened after close()
+            self._closed.clear()
+            self._flusher = None
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush, daemon=True)
+            self._flusher.start()
+
+    def _path(self, n):
+        return os.path.join(self.outdir, "{}_{:03d}.{}".format(self._name, n, self.fmt))
+
+    def _rotate(self):
+        if self._file:
+            self._file.close()
+        os.makedirs(self.outdir, exist_ok=True)
+        path = self._path(len(self.paths))
+        self._file = open(path, "wb", buffering=65536)
+        self._size = 0
+        self.paths.append(path)
+        if self.fmt == "csv":
+            header = _csv_row([ "time", "step", "simulator", "scenario", "stat", "value" ]).encode("utf-8")
+            self._file.write(header)
+            self._size += len(header)
+        self._start_flusher()
+
+def _csv_row(values):
+    out = io.StringIO()
+    csv.writer(out, lineterminator="\n").writerow([ "" if v is None else v for v in values ])
+    return out.getvalue()
 
 # OPS
 
@@ -173,27 +724,139 @@ class Label():
 
     def __init__(self, args, index):
         self.label = args # string
+        self.index = str(index)
         self.idx = str(" ").rjust(padding, " ")
 
     def exec(self, dry_run=False):
-        logger.info("{}  LABEL  {}".format(self.idx, self.label))
+        _log("{}  LABEL  {}".format(self.idx, self.label))
 
 
 class Jump():
 
     def __init__(self, args, index):
         self.jump_to = args # string
+        self.index = str(index)
         self.idx = str(index).rjust(padding, " ")
 
     def exec(self, dry_run=False):
-        logger.info("{}: JUMP   {}".format(self.idx, self.jump_to))
+        _log("{}: JUMP   {}".format(self.idx, self.jump_to))
         return None if dry_run else self.jump_to
 
 
+class Parallel():
+
+    """
+    Block of steps run concurrently and joined at the end of the block.
+    Each item of `steps` is a branch: either a single step or a list of
+    steps run one after the other.
+    """
+
+    def __init__(self, args, create, index):
+        steps = args.get("steps", []) if isinstance(args, dict) else args
+        self.timeout = args.get("timeout") if isinstance(args, dict) else None
+        self.idx = str(index).rjust(padding, " ")
+        self.branches = []
+        self._errors = []
+        n = 0
+        for item in steps or []:
+            branch = []
+            for step in item if isinstance(item, list) else [ item ]:
+                n += 1
+                try:
+                    branch.append(create(step, "{}.{}".format(index, n)))
+                except Exception as e:
+                    self._errors.append("{}.{}: {}".format(index, n, " ".join(map(str, e.args))))
+            self.branches.append(branch)
+
+    def validate(self):
+        errors = list(self._errors)
+        if not self.branches:
+            errors.append("{}: empty parallel block".format(self.idx.strip()))
+        for branch in self.branches:
+            for op in branch:
+                if isinstance(op, Op):
+                    errors += [ "{}: {}".format(op.idx.strip(), e) for e in op.validate() ]
+                elif isinstance(op, Parallel):
+                    errors += op.validate()
+        return errors
+
+    def exec(self, dry_run=False):
+        _log("{}: PARALLEL {} branches{}".format(
+            self.idx,
+            len(self.branches),
+            ", timeout {}s".format(self.timeout) if self.timeout else ""))
+
+        _pad = " " * (padding + 1)
+
+        if dry_run:
+            for branch in self.branches:
+                for op in branch:
+                    op.exec(dry_run=True)
+            _log("{} JOIN".format(_pad))
+            return
+
+        start = _clock.monotonic()
+        origin = _clock.fork()
+        cancel = threading.Event()
+        buffers = [ [] for _ in self.branches ]
+        ends = [ None ] * len(self.branches)
+        clock = getattr(_local, "clock", None)
+        workers = _workers()
+
+        def _run(b):
+            _local.clock = clock
+            _local.workers = workers
+            _local.buffer = buffers[b]
+            _local.cancel = cancel
+            _clock.enter(origin)
+            try:
+                for op in self.branches[b]:
+                    if cancel.is_set():
+                        break
+                    _clock.record(op)
+                    op.exec(dry_run=False)
+            finally:
+                _local.buffer = None
+                _local.cancel = None
+                ends[b] = _clock.leave()
+                _local.clock = None
+                _local.workers = None
+
+        executor = ThreadPoolExecutor(max_workers=len(self.branches))
+        futures = [ executor.submit(_run, b) for b in range(len(self.branches)) ]
+        # on a virtual clock branches take no real time, so the timeout
+        # is checked against the time they joined at instead
+        done, pending = wait(futures, timeout=None if _clock.virtual else self.timeout)
+        if pending:
+            cancel.set()
+        # cancelled branches stop at their next poll or sleep, and only
+        # requests already sent are waited for before the block ends
+        executor.shutdown(wait=True)
+        done = set(futures) - set(pending)
+        _clock.join(ends)
+        if self.timeout and _clock.virtual and _clock.monotonic() - start > self.timeout:
+            pending = True
+
+        # branch logs are written in branch order, not as they happened
+        for buffer in buffers:
+            for level, message in list(buffer):
+                _log(message, level)
+
+        for future in futures:
+            if future in done and future.exception():
+                raise future.exception()
+
+        if pending:
+            raise TimeoutError("{}: parallel block timed out after {}s".format(self.idx.strip(), self.timeout))
+
+        _log("{} JOIN   {:.1f}s".format(_pad, _clock.monotonic() - start))
+
+
 class Op:
 
     def __init__(self, args, titansims, index):
         self.args = args
+        self.index = str(index)
         self.idx = str(index).rjust(padding, " ")
         self.titansims = _select_titansims(args, titansims)
         self._scenario = args.get("scenario") if isinstance(args, dict) else None
@@ -202,6 +865,53 @@ class Op:
     def exec(self):
         pass
 
+    def validate(self):
+        """
+        Return a list of problems with the step arguments.
+        """
+        return []
+
+    def _check(self):
+        """
+        Raise ConnectionError if a selected simulator is known to be
+        unreachable, before changing the state of any of them.
+        """
+        down = [ ts for ts, settings in self.titansims.items() if not settings.get("client").available() ]
+        if down:
+            raise ConnectionError("TitanSim unreachable: {}".format(", ".join(down)))
+
+    def _each(self, func, log=True):
+        """
+        Call `func` with the name and client of each selected simulator
+        concurrently, at most `parallelism` at a time. Log when each call
+        started and how long it took (if `log`), and return a dict of
+        simulator name to result.
+        """
+        start = time.monotonic()
+        offsets = {}
+
+        def _call(ts):
+            offsets[ts] = time.monotonic() - start
+            # requests not sent yet are dropped once the branch timed out
+            if _cancelled():
+                return None
+            return func(ts, self.titansims[ts].get("client"))
+
+        results = _map(_call, list(self.titansims.keys()), _workers())
+
+        _pad = " " * (padding + 2)
+        for ts, (result, error, elapsed) in results.items() if log else []:
+            _log("{}{}: +{:.0f} ms, {:.0f} ms{}".format(
+                _pad, ts,
+                offsets.get(ts, 0) * 1000,
+                elapsed * 1000,
+                " ({})".format(error) if error else ""))
+        for ts, (result, error, elapsed) in results.items():
+            if error:
+                raise error
+
+        return { ts: result for ts, (result, error, elapsed) in results.items() }
+
 
 class JumpIf(Op):
 
@@ -211,16 +921,14 @@ class JumpIf(Op):
         self.jump_to = args.get("to")
 
     def exec(self, dry_run=False):
-        logger.info("{}: JUMPIF {} on {} to {}".format(self.idx, self.condition, ", ".join(list(self.titansims.keys())), self.jump_to))
+        _log("{}: JUMPIF {} on {} to {}".format(self.idx, self.condition, ", ".join(list(self.titansims.keys())), self.jump_to))
         mode, value, operator, operand = self._parse_cond(self.condition)
         results = []
 
         if mode and not mode in ["all", "avg"]:
             raise Exception("unknown term: {}".format(mode))
 
-        for ts, settings in self.titansims.items():
-            client = settings.get("client")
-            values = client.batch([value], scenario_filter=self._filter)
+        for ts, values in self._each(lambda ts, client: client.batch([value], name_filter=self._filter)).items():
             results.append(self._evaluate(mode, value, values, operator, operand))
 
         if mode == "all":
@@ -228,6 +936,12 @@ class JumpIf(Op):
         else:
             return self.jump_to if any(results) else None
 
+    def validate(self):
+        mode, value, operator, operand = self._parse_cond(self.condition)
+        if not value:
+            return [ "invalid condition: {}".format(self.condition) ]
+        return []
+
     def _evaluate(self, mode, value, values, operator, operand):
         comp = None
         _operand = float(operand)
@@ -273,17 +987,20 @@ class Start(Op):
             client = settings.get("client")
             log_message.append("{} ({})".format(ts, len(client.scenarios(self._filter)) if self._filter else "all"))
 
-        logger.info("{}: {}{}".format(self.idx, self._client_method.upper().ljust(7), ", ".join(log_message)))
+        _log("{}: {}{}".format(self.idx, self._client_method.upper().ljust(7), ", ".join(log_message)))
 
         if dry_run:
             return
 
-        for ts, settings in self.titansims.items():
-            client = settings.get("client")
+        self._check()
+
+        def _trigger(ts, client):
             if not self._filter:
                 getattr(client, self._client_method + "_all")()
             else:
-                client.batch(self._client_method, scenario_filter=self._filter)
+                client.batch(self._client_method, name_filter=self._filter)
+
+        self._each(_trigger)
         _poll(self.titansims,
               self.phase,
               self.state,
@@ -307,14 +1024,12 @@ class Exit(Op):
 
     def exec(self, dry_run=False):
 
-        logger.info("{}: EXIT   {}".format(self.idx, ", ".join(list(self.titansims.keys()))))
+        _log("{}: EXIT   {}".format(self.idx, ", ".join(list(self.titansims.keys()))))
 
         if dry_run:
             return
 
-        for ts, settings in self.titansims.items():
-            client = settings.get("client")
-            client.exit()
+        self._each(lambda ts, client: client.exit())
 
 
 class Ready(Op):
@@ -323,7 +1038,7 @@ class Ready(Op):
         super().__init__(args, titansims, index)
 
     def exec(self, dry_run=False):
-        logger.info("{}: READY  {}".format(self.idx, ", ".join(list(self.titansims.keys()))))
+        _log("{}: READY  {}".format(self.idx, ", ".join(list(self.titansims.keys()))))
 
         if dry_run:
             return
@@ -336,6 +1051,8 @@ class Stat(Op):
         super().__init__(args, titansims, index)
         self.stats = list(map(lambda v: v.strip(), args.get("name").split(",")))
         self.outdir = outdir
+        self.table = args.get("table", True)
+        self.writer = None
 
     def exec(self, dry_run=False):
 
@@ -353,28 +1070,29 @@ class Stat(Op):
                         value_dict[s] = ""
             return value_dict
 
-        logger.info("{}: STAT   {} ({})".format(self.idx, ", ".join(self.stats), ", ".join(list(self.titansims.keys()))))
+        _log("{}: STAT   {} ({})".format(self.idx, ", ".join(self.stats), ", ".join(list(self.titansims.keys()))))
         if dry_run: return
-        outdata = {}
-        table = PrettyTable()
-        table.field_names = ["scenario", "simulator"] + self.stats
-        table.align["scenario"] = "l"
-        for ts, settings in self.titansims.items():
-            client = settings.get("client")
-            stats = client.batch(self.stats, scenario_filter=self._filter)
-            outdata[ts] = stats
+        outdata = self._each(lambda ts, client: client.batch(self.stats, name_filter=self._filter))
+
+        if self.table:
+            table = PrettyTable()
+            table.field_names = ["scenario", "simulator"] + self.stats
+            table.align["scenario"] = "l"
             for s in self.stats: table.align[s] = "r"
-            for scenario, values in stats.items():
-                table.add_row([ scenario, ts ] + list(map(lambda s: values[s] if values[s] is not None else "", self.stats)))
-        logger.info("          (table)\n{}".format(table))
+            for ts, stats in outdata.items():
+                for scenario, values in stats.items():
+                    table.add_row([ scenario, ts ] + list(map(lambda s: values.get(s) if values.get(s) is not None else "", self.stats)))
+            _log("          (table)\n{}".format(table))
 
         avg = self.args.get("avg")
         if avg:
             average = _avg(outdata, list(map(lambda s: s.strip(), avg.split(","))))
             for key in average.keys():
-                logger.info("average {}: {}".format(key, average.get(key)))
+                _log("average {}: {}".format(key, average.get(key)))
 
-        if self.outdir:
+        if self.writer:
+            self.writer.write(self.idx.strip(), outdata, self.stats)
+        elif self.outdir:
             outfile_name = "{}_{}.yaml".format(
                 datetime.datetime.now().strftime('%Y-%m-%d_%H:%M:%S'),
                 "_".join(self.stats)
@@ -394,12 +1112,11 @@ class Reset(Op):
         super().__init__(args, titansims, index)
 
     def exec(self, dry_run=False):
-        logger.info("{}: RESET  {}".format(self.idx, ", ".join(list(self.titansims.keys()))))
+        _log("{}: RESET  {}".format(self.idx, ", ".join(list(self.titansims.keys()))))
         if dry_run:
             return
-        for ts, settings in self.titansims.items():
-            client = settings.get("client")
-            client.reset()
+        self._check()
+        self._each(lambda ts, client: client.reset())
 
 
 class Wait(Op):
@@ -409,59 +1126,374 @@ class Wait(Op):
         self.secs, self.time, self.name = self._parse(args) # string
 
     def exec(self, dry_run=False):
-        logger.info("{}: WAIT   {} {}".format(self.idx, self.time, self.name))
+        _log("{}: WAIT   {} {}".format(self.idx, self.time, self.name))
         if dry_run: return
-        time.sleep(self.secs)
+        _sleep(self.secs)
 
     def _parse(self, string):
-        time_rx = re.compile(r"^(\d+)(s|m|h|d)?$")
-        is_time = time_rx.match(string)
-        if is_time:
-            time, unit = is_time.groups()
-            multiplier = 1
-            name = "second{}".format("s" if multiplier == 1 else "")
-            if unit == "m":
-                name = "minute{}".format("s" if multiplier == 1 else "")
-                multiplier = 60
-            if unit == "h":
-                name = "hour{}".format("s" if multiplier == 1 else "")
-                multiplier = 3600
-            if unit == "d":
-                name = "day{}".format("s" if multiplier == 1 else "")
-                multiplier = 86400
-            return int(time) * multiplier, time, name
+        return _parse_time(string)
+
+
+class At(Op):
+
+    """
+    Wait until a wall clock time: the next "HH:MM[:SS]" (today or
+    tomorrow), or a "YYYY-MM-DD HH:MM[:SS]" date and time. The wait is
+    converted to a monotonic deadline when the step starts, so the step
+    ends on time regardless of how long the previous steps took.
+    """
+
+    def __init__(self, args, titansims, index):
+        super().__init__(args, titansims, index)
+        self.at = args.get("time") if isinstance(args, dict) else args
+
+    def validate(self):
+        if isinstance(self.at, int):
+            # unquoted HH:MM is a base 60 integer in YAML 1.1
+            return [ "invalid time {}, quote times like \"14:30\"".format(self.at) ]
+        try:
+            self._target(datetime.datetime.now())
+        except ValueError:
+            return [ "invalid time: {}".format(self.at) ]
+        return []
+
+    def exec(self, dry_run=False):
+        if dry_run:
+            _log("{}: AT     {}".format(self.idx, self.at))
+            return
+        now = datetime.datetime.fromtimestamp(_clock.time())
+        target = self._target(now)
+        delay = (target - now).total_seconds()
+        _log("{}: AT     {} (in {:.0f}s)".format(self.idx, target.strftime("%Y-%m-%d %H:%M:%S"), max(delay, 0)))
+        if delay < 0:
+            _log("{}  {} already passed".format(" " * padding, target), logging.WARNING)
+            return
+        _sleep_until(_clock.monotonic() + delay)
+
+    def _target(self, now):
+        if isinstance(self.at, datetime.datetime):
+            return self.at
+        value = str(self.at).strip()
+        for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M"):
+            try:
+                return datetime.datetime.strptime(value, fmt)
+            except ValueError:
+                pass
+        for fmt in ("%H:%M:%S", "%H:%M"):
+            try:
+                t = datetime.datetime.strptime(value, fmt).time()
+                break
+            except ValueError:
+                pass
         else:
-            raise Exception("Couldn't parse time operand", string)
+            raise ValueError(value)
+        target = datetime.datetime.combine(now.date(), t)
+        return target if target > now else target + datetime.timedelta(days=1)
+
+
+class Every(Op):
+
+    """
+    Wait until the next multiple of `period` since the step first ran,
+    e.g. at the top of a loop that has to repeat on a fixed schedule.
+    The first run doesn't wait. Deadlines are kept on the monotonic
+    clock, so the time taken by the steps in between doesn't add up. A
+    late run doesn't wait either, and ticks missed entirely are
+    skipped.
+    """
+
+    def __init__(self, args, titansims, index):
+        super().__init__(args, titansims, index)
+        self.period = args.get("period") if isinstance(args, dict) else args
+        self._start = None
+        self._tick = 0
+
+    def validate(self):
+        try:
+            if _seconds(self.period) <= 0:
+                raise Exception()
+        except Exception:
+            return [ "invalid period: {}".format(self.period) ]
+        return []
+
+    def exec(self, dry_run=False):
+        if dry_run:
+            _log("{}: EVERY  {}".format(self.idx, self.period))
+            return
+        period = _seconds(self.period)
+        now = _clock.monotonic()
+        if self._start is None:
+            self._start, self._tick = now, 0
+            _log("{}: EVERY  {} (tick 0)".format(self.idx, self.period))
+            return
+        tick = self._tick + 1
+        deadline = self._start + tick * period
+        if now > deadline:
+            # late: run now as the latest tick due, skipping older ones
+            self._tick = int((now - self._start) // period)
+            _log("{}: EVERY  {} (tick {}, {:.1f}s late)".format(
+                self.idx, self.period, self._tick, now - self._start - self._tick * period), logging.WARNING)
+            if self._tick > tick:
+                _log("{}  {} tick(s) missed".format(" " * padding, self._tick - tick), logging.WARNING)
+            return
+        self._tick = tick
+        _log("{}: EVERY  {} (tick {}, in {:.1f}s)".format(self.idx, self.period, tick, deadline - now))
+        _sleep_until(deadline)
+
+_FEEDBACK = {
+    "call_cps": ("call_total", "call_gos"),
+    "message_cps": ("message_sent", "message_gos"),
+    "cps": ("total", "gos"),
+    "rps": ("registration_total", "registration_gos"),
+    "sps": ("subscribe_total", "subscribe_gos")}
+"""
+Counter and GoS stats used as feedback for each settable rate
+"""
+
+class Ramp(Op):
+
+    """
+    Move the rate `value` of the selected scenarios toward `target` by
+    at most `step` every `interval`, using the measured GoS and achieved
+    rate as feedback. Each tick reads the rate, counter and GoS of all
+    scenarios in one request per simulator and writes the new rates in
+    another. A scenario stops at its last good rate once its GoS falls
+    below `min_gos` or its achieved rate falls more than `tolerance`
+    percent short of the rate set.
+    """
+
+    def __init__(self, args, titansims, index):
+        super().__init__(args, titansims, index)
+        self.value = args.get("value", "call_cps")
+        counter, gos = _FEEDBACK.get(self.value, (None, None))
+        self.counter = args.get("counter", counter)
+        self.gos = args.get("gos", gos)
+        self.target = args.get("target")
+        self.step = args.get("step")
+        self.interval = _seconds(args.get("interval", 10))
+        self.min_gos = args.get("min_gos")
+        self.tolerance = args.get("tolerance", 10)
+        self.timeout = _seconds(args.get("timeout", 3600))
+        self.result = {}
+        "Final rate per simulator and scenario, after `exec`"
+
+    def validate(self):
+        errors = []
+        if not self.counter or not self.gos:
+            errors.append("no feedback stats for {}, set counter and gos".format(self.value))
+        if not isinstance(self.target, (int, float)):
+            errors.append("missing or invalid target: {}".format(self.target))
+        if not isinstance(self.step, (int, float)) or self.step <= 0:
+            errors.append("missing or invalid step: {}".format(self.step))
+        return errors
+
+    def exec(self, dry_run=False):
+        _log("{}: RAMP   {} to {} by {}/{}s{} ({})".format(
+            self.idx, self.value, self.target, self.step, self.interval,
+            ", GoS >= {}".format(self.min_gos) if self.min_gos is not None else "",
+            ", ".join(list(self.titansims.keys()))))
+        if dry_run: return
+        self._check()
+        self._control(self._next, self.timeout)
+
+    def _next(self, point, achieved, gos):
+        """
+        Return the next rate of a scenario and whether it's done.
+        """
+        applied = point["applied"]
+        limited = (self.min_gos is not None and gos is not None and gos < self.min_gos) \
+            or (achieved is not None and applied > 0 and achieved < applied * (1 - self.tolerance / 100))
+        if limited:
+            return point["good"], True
+        point["good"] = applied
+        if applied < self.target:
+            rate = min(applied + self.step, self.target)
+        else:
+            rate = max(applied - self.step, self.target)
+        return rate, rate == self.target
+
+    def _control(self, next_rate, duration):
+        stats = [ self.value, self.counter, self.gos ]
+        points = {}
+        deadline = _clock.monotonic() + duration
+        tick = _clock.monotonic()
+        n = 0
+
+        while True:
+            n += 1
+            now = _clock.monotonic()
+            results = self._each(lambda ts, client: client.batch(stats, name_filter=self._filter), log=False)
+
+            values = {}
+            for ts, scenarios in results.items():
+                for scenario, v in scenarios.items():
+                    if v.get(self.value) is None:
+                        continue
+                    point = points.get((ts, scenario))
+                    if point is None:
+                        point = points[(ts, scenario)] = {
+                            "applied": v[self.value], "good": v[self.value], "done": False,
+                            "counter": v.get(self.counter), "time": now }
+                        achieved = None
+                    else:
+                        achieved = _rate(point, v.get(self.counter), now)
+                    if point["done"]:
+                        continue
+                    rate, point["done"] = next_rate(point, achieved, v.get(self.gos))
+                    _log("{}  {} {} {} {:g} (achieved {}, GoS {})".format(
+                        " " * padding, ts, scenario, self.value, rate,
+                        "-" if achieved is None else "{:.2f}".format(achieved),
+                        "-" if v.get(self.gos) is None else v.get(self.gos)))
+                    if rate != point["applied"]:
+                        values.setdefault(ts, {})[scenario] = { self.value: rate }
+                        point["applied"] = rate
+
+            if values:
+                self._each(lambda ts, client: values.get(ts) and client.batch(
+                    self.value,
+                    values=values[ts],
+                    name_filter="^({})$".format("|".join(map(re.escape, values[ts].keys())))), log=False)
+
+            if points and all([ p["done"] for p in points.values() ]):
+                break
+            if _clock.monotonic() >= deadline:
+                break
+
+            tick += self.interval
+            _sleep(max(min(tick, deadline) - _clock.monotonic(), 0))
+            if _cancelled():
+                break
+
+        self.result = {}
+        for (ts, scenario), point in points.items():
+            self.result.setdefault(ts, {})[scenario] = point["applied"]
+        _log("{}  {} ticks, {}: {}".format(" " * padding, n, self.value, self.result))
+
+
+class Hold(Ramp):
+
+    """
+    Keep the achieved rate `value` of the selected scenarios at `target`
+    (default: the rate set when the step starts) for `duration`,
+    correcting the rate set every `interval` by at most `step`. A
+    warning is logged when GoS falls below `min_gos`; with `abort`, the
+    playlist is stopped instead.
+    """
+
+    def __init__(self, args, titansims, index):
+        super().__init__(args, titansims, index)
+        self.duration = _seconds(args.get("duration", 60))
+        self.abort = args.get("abort", False)
+
+    def validate(self):
+        errors = []
+        if not self.counter or not self.gos:
+            errors.append("no feedback stats for {}, set counter and gos".format(self.value))
+        if self.target is not None and not isinstance(self.target, (int, float)):
+            errors.append("invalid target: {}".format(self.target))
+        if self.step is not None and (not isinstance(self.step, (int, float)) or self.step <= 0):
+            errors.append("invalid step: {}".format(self.step))
+        return errors
+
+    def exec(self, dry_run=False):
+        _log("{}: HOLD   {} at {} for {}s{} ({})".format(
+            self.idx, self.value, self.target if self.target is not None else "current", self.duration,
+            ", GoS >= {}".format(self.min_gos) if self.min_gos is not None else "",
+            ", ".join(list(self.titansims.keys()))))
+        if dry_run: return
+        self._check()
+        self._control(self._next, self.duration)
+
+    def _next(self, point, achieved, gos):
+        if self.min_gos is not None and gos is not None and gos < self.min_gos:
+            message = "GoS {} below {}".format(gos, self.min_gos)
+            if self.abort:
+                raise Exception(message)
+            _log("{}  {}".format(" " * padding, message), logging.WARNING)
+        target = point.setdefault("target", self.target if self.target is not None else point["applied"])
+        if achieved is None:
+            return point["applied"], False
+        correction = target - achieved
+        if abs(correction) <= target / 100:
+            # within 1% of target; don't chase measurement noise
+            return point["applied"], False
+        if self.step is not None:
+            correction = max(min(correction, self.step), -self.step)
+        return max(round(point["applied"] + correction, 3), 0), False
+
+
+def _rate(point, counter, now):
+    """
+    Return the rate of `counter` since the previous sample in `point`
+    and store the new sample.
+    """
+    previous, then = point["counter"], point["time"]
+    point["counter"], point["time"] = counter, now
+    if previous is None or counter is None or counter < previous or now <= then:
+        return None
+    return (counter - previous) / (now - then)
 
 class Set(Op):
 
     def __init__(self, args, titansims, index):
         super().__init__(args, titansims, index)
         self.value_names = list(set(args) - set(["scenario", "titansim"]))
+        # value expressions are compiled once, when the playlist is
+        # loaded, into (base, function) pairs
+        self._expressions = { value: self._compile(args.get(value)) for value in self.value_names }
 
     def exec(self, dry_run=False):
-        values_to_send_all = {}
-        for ts, settings in self.titansims.items():
-            values = {}
-            client = settings.get("client")
+
+        def _values(ts, client):
+            # one snapshot of the current values per simulator and step
+            current_names = [ v for v, (base, _) in self._expressions.items() if base == "current" ]
+            snapshot = {
+                "current": client.batch(current_names, name_filter=self._filter) if current_names else {},
+                "default": self.titansims[ts].get("default") or {}}
+            values_to_send = {}
             for s in client.scenarios(self._filter):
-                for value in self.value_names:
-                    if not values.get(s.name):
-                        values[s.name] = {}
-                    values[s.name][value] = self.args.get(value)
-            # before running, ensure that current/original etc is handled properly
-            values_to_send = self._resolve_values(values, settings)
+                for value_name, (base, apply) in self._expressions.items():
+                    _base = None
+                    if base:
+                        _ = snapshot[base].get(s.name, {}).get(value_name)
+                        if _ is None: continue
+                        _base = float(_)
+                    value = apply(_base)
+                    if value is not None:
+                        values_to_send.setdefault(s.name, {})[value_name] = value
             n=len(values_to_send.keys()) if self._filter else "all"
-            values_to_send_all[ts] = { "length": n, "values": values_to_send }
+            return { "length": n, "values": values_to_send }
+
+        values_to_send_all = {}
+        for ts, values in _map(lambda ts: _values(ts, self.titansims[ts].get("client")),
+                               list(self.titansims.keys()), _workers()).items():
+            result, error, elapsed = values
+            if error:
+                raise error
+            values_to_send_all[ts] = result
 
         self._log(values_to_send_all)
 
         if dry_run: return
 
-        for ts, settings in self.titansims.items():
-            values = values_to_send_all[ts].get("values")
-            client = settings.get("client")
-            client.batch(self.value_names, values=values, scenario_filter=self._filter)
+        self._check()
+        self._each(lambda ts, client: client.batch(
+            self.value_names,
+            values=values_to_send_all[ts].get("values"),
+            name_filter=self._filter))
+
+    def validate(self):
+        errors = []
+        if not self.value_names:
+            errors.append("no values to set")
+        for value_name in self.value_names:
+            value = self.args.get(value_name)
+            if isinstance(value, (int, float)) or str(value).isdigit():
+                continue
+            base, operator, operand, percentage = self._parse_expression(value)
+            if not base or (operator and not operand):
+                errors.append("invalid expression for {}: {}".format(value_name, value))
+        return errors
 
     def _log(self, values):
 
@@ -474,71 +1506,49 @@ class Set(Op):
                 n = values[ts]["length"]
                 if i == 0:
                     i += 1
-                    logger.info("{}: SET    {} to {} on {} ({} scen.)".format(self.idx, value, change, ts, n))
+                    _log("{}: SET    {} to {} on {} ({} scen.)".format(self.idx, value, change, ts, n))
                 else:
-                    logger.info("{} to {} on {} ({} scen.)".format(value, change, ts, n))
+                    _log("{} to {} on {} ({} scen.)".format(value, change, ts, n))
 
         for ts in ts_list:
             if values[ts]["length"] == "all":
                 continue
             for s in values[ts]["values"].keys():
-                logger.info("{} on {}".format(s, ts))
+                _log("{} on {}".format(s, ts))
 
     def _parse_expression(self, string):
         expression_rx = re.compile(r"(current|default)\s*([\*+-\/])?\s*([\d\.]*)?(%)?")
         expression = None if not isinstance(string, str) else expression_rx.match(string)
         return expression.groups() if expression else [ None, None, None, None ]
 
-    def _resolve_values(self, values, settings):
-        current = None
-        client = settings.get("client")
-        values_to_send = {}
-        for value_name in self.value_names:
-            for s in client.scenarios(self._filter):
-                expression = values[s.name][value_name]
-                value = expression
-                if str(value).isdigit():
-                    pass
-                elif isinstance(value, str):
-                    base, operator, operand, percentage = self._parse_expression(expression)
-
-                    variable = base
-                    if base == "current" and not current:
-                        current = client.batch(["call_cps", "message_cps", "cps", "rps"])
-                    _base = None
-                    if (base == "current" or not base) and current:
-                        _ = current.get(s.name, {}).get(value_name)
-                        _base = float(_) if _ is not None else None
-                    if base == "default":
-                        _ = settings["default"][s.name][value_name]
-                        _base = float(_) if _ is not None else None
-                    if _base is None: continue
-
-                    if _base is not None and not operator:
-                        base = _base
-
-                    if operator:
-
-                        if not operand:
-                            raise Exception("Missing operand in", value)
-
-                        operand = float(operand)
-                        pct_dec = operand / 100
-
-                        if operator == "*":
-                            value = _base * pct_dec if percentage else _base * operand
-                        elif operator == "/":
-                            value = _base / pct_dec if percentage else _base / operand
-                        elif operator == "+":
-                            value = _base + pct_dec * _base if percentage else _base + operand
-                        elif operator == "-":
-                            value = _base - pct_dec * _base if percentage else _base - operand
-                    else:
-                        value = base
-                if value is not None:
-                    if not values_to_send.get(s.name):
-                        values_to_send[s.name] = {}
-                    values_to_send[s.name][value_name] = value
-        return values_to_send
+    def _compile(self, expression):
+        """
+        Return the base ("current", "default" or None) of value
+        `expression` and a function computing the value from the base
+        value.
+        """
+        if not isinstance(expression, str) or expression.isdigit():
+            return None, lambda _base: expression
+
+        base, operator, operand, percentage = self._parse_expression(expression)
+        if not base or (operator and not operand):
+            # reported by validate
+            return None, lambda _base: None
+
+        if not operator:
+            return base, lambda _base: _base
+
+        operand = float(operand)
+        pct_dec = operand / 100
+
+        if operator == "*":
+            return base, lambda _base: _base * pct_dec if percentage else _base * operand
+        elif operator == "/":
+            return base, lambda _base: _base / pct_dec if percentage else _base / operand
+        elif operator == "+":
+            return base, lambda _base: _base + pct_dec * _base if percentage else _base + operand
+        elif operator == "-":
+            return base, lambda _base: _base - pct_dec * _base if percentage else _base - operand
+        return base, lambda _base: expression
 
 __all__ = ["Playlist"]
@@ -0,0 +1,728 @@
+"""
+Keep-alive HTTP sessions for DsREST endpoints.
+
+Every `DsRequest` and `APIClient` call goes through the process-wide
+`sessions` pool, which keeps one `requests.Session` per endpoint
+(scheme, host and port) so that repeated polls of the same TitanSim
+reuse an open TCP connection instead of opening a new one per request.
+
+``` python
+>>> from titanclient.api.session import sessions
+>>> sessions.configure(maxsize=20, timeout=10)
+>>> sessions.stats()
+{'http://10.10.10.10:8080': {'requests': 42, 'hits': 41, 'misses': 1}}
+```
+
+`async_sessions` is the asyncio counterpart used by
+`DsRequest.send_async`. It keeps idle HTTP/1.1 connections per endpoint
+and event loop, so a single loop can poll many TitanSims concurrently
+without a thread per host. The connections of a loop are closed when
+the loop shuts down, e.g. at the end of `asyncio.run`.
+
+Both pools retry failed requests according to a `RetryPolicy` and
+share a `CircuitBreaker` per endpoint in `breakers`. After
+`http_breaker_threshold` consecutive failed requests (each after its
+retries), requests to the
+endpoint fail immediately with `CircuitOpenError` for
+`http_breaker_reset` seconds, after which a single trial request is let
+through:
+
+``` python
+>>> from titanclient.api.session import breakers
+>>> breakers.available("http://10.10.10.10:8080/api.dsapi")
+False
+>>> breakers.stats()
+{'http://10.10.10.10:8080': {'state': 'open', 'failures': 3, 'retry_in': 21.3}}
+```
+"""
+
+import time
+import random
+import asyncio
+import threading
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+from ..common.config import settings
+
+
+def endpoint(url):
+    """
+    Return the scheme://host:port part of `url`.
+    """
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+
+    """
+    Raised instead of sending a request to an endpoint whose circuit
+    breaker is open.
+    """
+
+
+class RetryPolicy:
+
+    """
+    Retry failed requests up to `retries` times, waiting `backoff`
+    seconds before the first retry and `factor` times longer before
+    each subsequent one, up to `max_backoff`. Each wait is randomized by
+    ±`jitter` (a fraction of the wait) so that clients of an overloaded
+    host don't retry in lockstep.
+
+    Requests that failed after they may have been sent (timeouts,
+    connections closed by the server) are retried only if `idempotent`,
+    i.e. the bundle only reads values; others only if the connection
+    couldn't be opened. Pools stop retrying once a request has taken
+    their timeout in total, so that a TitanSim that doesn't respond
+    isn't waited for several times.
+    """
+
+    def __init__(self, retries=2, backoff=0.2, factor=2, max_backoff=5, jitter=0.5):
+        self.retries = retries
+        self.backoff = backoff
+        self.factor = factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+
+    def __repr__(self):
+        return f"<RetryPolicy {self.retries}x {self.backoff}s>"
+
+    def delays(self):
+        """
+        Yield the wait before each retry.
+        """
+        delay = self.backoff
+        for _ in range(self.retries):
+            yield max(delay * (1 + random.uniform(-self.jitter, self.jitter)), 0)
+            delay = min(delay * self.factor, self.max_backoff)
+
+    def retryable(self, error, idempotent=True):
+        """
+        Return true if a request that failed with `error` can be
+        retried.
+        """
+        if isinstance(error, CircuitOpenError):
+            return False
+        if _unsent(error):
+            return True
+        return idempotent and isinstance(
+            error, (requests.exceptions.RequestException, asyncio.TimeoutError, OSError))
+
+
+def _unsent(error):
+    """
+    Return true if `error` was raised while connecting, i.e. before the
+    request was sent.
+    """
+    if isinstance(error, (requests.exceptions.ConnectTimeout, ConnectionRefusedError, NewConnectionError)):
+        return True
+    # requests wraps urllib3 errors: ConnectionError(MaxRetryError(reason))
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, (ConnectTimeoutError, ConnectionRefusedError))
+
+
+class CircuitBreaker:
+
+    """
+    Circuit breaker of one endpoint. The circuit opens after
+    `threshold` consecutive failures and stays open for `reset`
+    seconds; then it is half-open and lets one trial request through,
+    which either closes or re-opens it.
+    """
+
+    def __init__(self, threshold=3, reset=30):
+        self.threshold = threshold
+        self.reset = reset
+        self.failures = 0
+        "Consecutive failures"
+        self._opened = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<CircuitBreaker {self.state}>"
+
+    @property
+    def state(self):
+        """
+        "closed", "open" or "half-open".
+        """
+        if self._opened is None:
+            return "closed"
+        if time.monotonic() - self._opened < self.reset:
+            return "open"
+        return "half-open"
+
+    def retry_in(self):
+        """
+        Return seconds until the circuit is half-open, 0 if it isn't
+        open.
+        """
+        if self._opened is None:
+            return 0
+        return max(self.reset - (time.monotonic() - self._opened), 0)
+
+    def allow(self):
+        """
+        Return true if a request may be sent now. In the half-open
+        state, only the first caller is allowed until it reports.
+        """
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def success(self):
+        """
+        Record a successful request and close the circuit.
+        """
+        with self._lock:
+            self.failures = 0
+            self._opened = None
+            self._trial = False
+
+    def cancel(self):
+        """
+        Give up a trial request without recording its outcome.
+        """
+        with self._lock:
+            self._trial = False
+
+    def failure(self):
+        """
+        Record a failed request and open the circuit if the threshold
+        is reached or the trial request failed.
+        """
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                self._opened = time.monotonic()
+            self._trial = False
+
+
+class CircuitBreakers:
+
+    """
+    `CircuitBreaker` per endpoint. `threshold` and `reset` apply to
+    breakers created after they are set with `configure`; a threshold
+    of 0 disables circuit breaking.
+    """
+
+    def __init__(self, threshold=3, reset=30):
+        self.threshold = threshold
+        self.reset = reset
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<CircuitBreakers {len(self._breakers)}>"
+
+    def configure(self, threshold=None, reset=None):
+        """
+        Change the failure threshold and/or the open period of all
+        breakers.
+        """
+        with self._lock:
+            if threshold is not None:
+                self.threshold = threshold
+            if reset is not None:
+                self.reset = reset
+            for breaker in self._breakers.values():
+                breaker.threshold = self.threshold
+                breaker.reset = self.reset
+
+    def get(self, url):
+        """
+        Return the breaker for the endpoint of `url`.
+        """
+        key = endpoint(url)
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if not breaker:
+                breaker = self._breakers[key] = CircuitBreaker(self.threshold, self.reset)
+            return breaker
+
+    def state(self, url):
+        """
+        Return the breaker state of the endpoint of `url`.
+        """
+        return self.get(url).state
+
+    def available(self, url):
+        """
+        Return false if requests to the endpoint of `url` currently
+        fail fast.
+        """
+        return not self.threshold or self.get(url).state != "open"
+
+    def stats(self, url=None):
+        """
+        Return state, consecutive failures and seconds until the next
+        trial request per endpoint, or for the endpoint of `url` only.
+        """
+        keys = [endpoint(url)] if url else list(self._breakers.keys())
+        result = {}
+        for key in keys:
+            breaker = self.get(key)
+            result[key] = {
+                "state": breaker.state,
+                "failures": breaker.failures,
+                "retry_in": round(breaker.retry_in(), 1)}
+        return result.get(endpoint(url), {}) if url else result
+
+    def reset_all(self):
+        """
+        Close all circuits.
+        """
+        with self._lock:
+            breakers = list(self._breakers.values())
+        for breaker in breakers:
+            breaker.success()
+
+
+class SessionPool:
+
+    """
+    Pool of keep-alive sessions keyed by endpoint.
+
+    `maxsize` is the number of connections kept open per endpoint,
+    `timeout` the HTTP read timeout and `connect_timeout` the TCP
+    connect timeout (defaults to `timeout`) in seconds.
+    """
+
+    def __init__(self, maxsize=10, timeout=5, connect_timeout=None, retry=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retry = retry or RetryPolicy()
+        "`RetryPolicy` of failed requests"
+        self._sessions = {}
+        self._requests = {}
+        self._closed = {}
+        self._adapters = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<SessionPool {len(self._sessions)}>"
+
+    def configure(self, maxsize=None, timeout=None, connect_timeout=None):
+        """
+        Change pool size and/or timeouts. Changing `maxsize` closes
+        any open sessions; they are re-created on the next request.
+        """
+        if timeout is not None:
+            self.timeout = timeout
+        if connect_timeout is not None:
+            self.connect_timeout = connect_timeout
+        if maxsize is not None and maxsize != self.maxsize:
+            self.maxsize = maxsize
+            self.close()
+
+    def session(self, url):
+        """
+        Return the shared session for the endpoint of `url`.
+        """
+        key = endpoint(url)
+        with self._lock:
+            session = self._sessions.get(key)
+            if not session:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=self.maxsize)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                if key in self._adapters:
+                    session.mount(key, self._adapters[key])
+                self._sessions[key] = session
+                self._requests.setdefault(key, 0)
+            self._requests[key] += 1
+            return session
+
+    def mount(self, url, adapter):
+        """
+        Send requests to the endpoint of `url` through the transport
+        adapter `adapter` (a `requests.adapters.BaseAdapter`) instead
+        of HTTP, e.g. to a simulated TitanSim.
+        """
+        key = endpoint(url)
+        self.close(url)
+        with self._lock:
+            self._adapters[key] = adapter
+
+    def unmount(self, url):
+        """
+        Send requests to the endpoint of `url` over HTTP again.
+        """
+        key = endpoint(url)
+        self.close(url)
+        with self._lock:
+            self._adapters.pop(key, None)
+
+    def post(self, url, data, timeout=None, idempotent=True):
+        """
+        POST `data` to `url` on the shared session. See `RetryPolicy`
+        for `idempotent`.
+        """
+        return self._call(
+            url,
+            lambda: self.session(url).post(url, data=data, timeout=self._timeout(timeout)),
+            idempotent,
+            timeout)
+
+    def get(self, url, timeout=None, retry=None):
+        """
+        GET `url` on the shared session. `retry` overrides the
+        `RetryPolicy` of the pool, e.g. `RetryPolicy(retries=0)` for a
+        single attempt.
+        """
+        return self._call(
+            url,
+            lambda: self.session(url).get(url, timeout=self._timeout(timeout)),
+            True,
+            timeout,
+            retry)
+
+    def _call(self, url, request, idempotent, timeout=None, retry=None):
+        breaker = breakers.get(url)
+        if breakers.threshold and not breaker.allow():
+            raise CircuitOpenError(f"circuit open for {endpoint(url)}")
+        retry = retry or self.retry
+        delays = retry.delays()
+        deadline = time.monotonic() + (timeout if timeout is not None else self.timeout)
+        while True:
+            try:
+                response = request()
+            except (requests.exceptions.RequestException, OSError) as e:
+                delay = next(delays, None)
+                if delay is None or time.monotonic() + delay >= deadline or not retry.retryable(e, idempotent):
+                    breaker.failure()
+                    raise
+            except BaseException:
+                breaker.cancel()
+                raise
+            else:
+                if response.status_code < 500:
+                    breaker.success()
+                    return response
+                delay = next(delays, None)
+                if delay is None or time.monotonic() + delay >= deadline:
+                    breaker.failure()
+                    return response
+            time.sleep(delay)
+
+    def stats(self, url=None):
+        """
+        Return request, hit (reused connection) and miss (new
+        connection) counters per endpoint, or for the endpoint of `url`
+        only.
+        """
+        with self._lock:
+            keys = [endpoint(url)] if url else list(self._requests.keys())
+            result = {}
+            for key in keys:
+                misses = self._closed.get(key, 0)
+                session = self._sessions.get(key)
+                if session:
+                    misses += _connections(session, key)
+                count = self._requests.get(key, 0)
+                result[key] = {
+                    "requests": count,
+                    "hits": max(count - misses, 0),
+                    "misses": misses}
+        return result.get(endpoint(url), {}) if url else result
+
+    def close(self, url=None):
+        """
+        Close the session for the endpoint of `url`, or all sessions.
+        Counters are preserved.
+        """
+        with self._lock:
+            keys = [endpoint(url)] if url else list(self._sessions.keys())
+            for key in keys:
+                session = self._sessions.pop(key, None)
+                if not session:
+                    continue
+                self._closed[key] = self._closed.get(key, 0) + _connections(session, key)
+                session.close()
+
+    def _timeout(self, timeout):
+        read = timeout if timeout is not None else self.timeout
+        return (self.connect_timeout or read, read)
+
+
+class AsyncSessionPool:
+
+    """
+    Pool of keep-alive asyncio HTTP/1.1 connections keyed by endpoint.
+
+    At most `maxsize` requests are in flight per endpoint; `timeout`
+    applies to each request as a whole.
+    """
+
+    def __init__(self, maxsize=10, timeout=5, retry=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.retry = retry or RetryPolicy()
+        "`RetryPolicy` of failed requests"
+        self._idle = {}
+        self._limits = {}
+        self._closers = {}
+        self._requests = {}
+        self._misses = {}
+
+    def __repr__(self):
+        return f"<AsyncSessionPool {len(self._idle)}>"
+
+    def configure(self, maxsize=None, timeout=None):
+        """
+        Change the per-endpoint concurrency limit and/or the timeout.
+        """
+        if timeout is not None:
+            self.timeout = timeout
+        if maxsize is not None:
+            self.maxsize = maxsize
+            self._limits = {}
+
+    async def post(self, url, data, timeout=None, idempotent=True):
+        """
+        POST `data` to `url`. Return an object with `status_code` and
+        `text` attributes. See `RetryPolicy` for `idempotent`.
+        """
+        return await self._call(url, "POST", data, timeout, idempotent)
+
+    async def get(self, url, timeout=None):
+        """
+        GET `url`. Return an object with `status_code` and `text`
+        attributes.
+        """
+        return await self._call(url, "GET", None, timeout, True)
+
+    async def _call(self, url, method, data, timeout, idempotent):
+        breaker = breakers.get(url)
+        if breakers.threshold and not breaker.allow():
+            raise CircuitOpenError(f"circuit open for {endpoint(url)}")
+        delays = self.retry.delays()
+        timeout = timeout if timeout is not None else self.timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                response = await asyncio.wait_for(self._request(method, url, data), timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                delay = next(delays, None)
+                if delay is None or time.monotonic() + delay >= deadline or not self.retry.retryable(e, idempotent):
+                    breaker.failure()
+                    raise
+            except BaseException:
+                breaker.cancel()
+                raise
+            else:
+                if response.status_code < 500:
+                    breaker.success()
+                    return response
+                delay = next(delays, None)
+                if delay is None or time.monotonic() + delay >= deadline:
+                    breaker.failure()
+                    return response
+            await asyncio.sleep(delay)
+
+    def stats(self, url=None):
+        """
+        Return request, hit and miss counters in the same format as
+        `SessionPool.stats`.
+        """
+        keys = [endpoint(url)] if url else list(self._requests.keys())
+        result = {}
+        for key in keys:
+            count = self._requests.get(key, 0)
+            misses = self._misses.get(key, 0)
+            result[key] = {
+                "requests": count,
+                "hits": max(count - misses, 0),
+                "misses": misses}
+        return result.get(endpoint(url), {}) if url else result
+
+    async def close(self):
+        """
+        Close idle connections of the running event loop.
+        """
+        self._release(asyncio.get_running_loop())
+
+    def _release(self, loop):
+        # close the idle connections of `loop` and drop its state
+        for (l, key) in list(self._idle.keys()):
+            if l is loop:
+                for reader, writer in self._idle.pop((l, key)):
+                    if not loop.is_closed():
+                        writer.close()
+        for (l, key) in list(self._limits.keys()):
+            if l is loop:
+                del self._limits[(l, key)]
+        self._closers.pop(loop, None)
+
+    async def _closer(self, loop):
+        # an async generator is closed by the loop on shutdown (e.g. at
+        # the end of asyncio.run), which releases the loop's connections
+        try:
+            yield
+        finally:
+            self._release(loop)
+
+    async def _watch(self, loop):
+        if loop in self._closers:
+            return
+        # drop the state of loops that were closed without a shutdown
+        for l in {l for (l, _) in list(self._limits.keys()) + list(self._idle.keys())}:
+            if l.is_closed():
+                self._release(l)
+        closer = self._closers[loop] = self._closer(loop)
+        await closer.asend(None)
+
+    async def _request(self, method, url, data):
+        key = endpoint(url)
+        loop = asyncio.get_running_loop()
+        await self._watch(loop)
+        limit = self._limits.get((loop, key))
+        if not limit:
+            limit = self._limits[(loop, key)] = asyncio.Semaphore(self.maxsize)
+        self._requests[key] = self._requests.get(key, 0) + 1
+        body = data.encode("utf-8") if isinstance(data, str) else (data or b"")
+
+        async with limit:
+            idle = self._idle.setdefault((loop, key), [])
+            while idle:
+                reader, writer = idle.pop()
+                if writer.is_closing():
+                    continue
+                try:
+                    return await self._exchange(reader, writer, idle, method, url, body)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    # the server closed the idle connection; retry on
+                    # a fresh one
+                    writer.close()
+            parts = urlsplit(url)
+            https = parts.scheme == "https"
+            reader, writer = await asyncio.open_connection(
+                parts.hostname,
+                parts.port or (443 if https else 80),
+                ssl=True if https else None)
+            self._misses[key] = self._misses.get(key, 0) + 1
+            try:
+                return await self._exchange(reader, writer, idle, method, url, body)
+            except asyncio.IncompleteReadError as e:
+                raise ConnectionError(f"connection closed by server: {e}") from e
+
+    async def _exchange(self, reader, writer, idle, method, url, body):
+        try:
+            status, headers, content = await self._roundtrip(reader, writer, method, url, body)
+        except BaseException:
+            writer.close()
+            raise
+
+        if headers.get("connection", "").lower() == "close":
+            writer.close()
+        else:
+            idle.append((reader, writer))
+
+        return SimpleNamespace(
+            status_code=status,
+            text=content.decode("utf-8"))
+
+    async def _roundtrip(self, reader, writer, method, url, body):
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        head = (
+            f"{method} {path} HTTP/1.1\r\n"
+            f"Host: {parts.netloc}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: keep-alive\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+        try:
+            return await self._response(reader)
+        except (ValueError, IndexError) as e:
+            # a malformed or truncated response; the caller closes the
+            # connection
+            raise ConnectionError(f"malformed response: {e}") from e
+
+    async def _response(self, reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed by server")
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            content = b""
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                content += await reader.readexactly(size)
+                await reader.readline()
+        elif "content-length" in headers:
+            content = await reader.readexactly(int(headers["content-length"]))
+        else:
+            content = await reader.read()
+            headers["connection"] = "close"
+
+        return status, headers, content
+
+
+def _connections(session, url):
+    """
+    Return the number of connections opened by `session` for `url`.
+    """
+    poolmanager = getattr(session.get_adapter(url), "poolmanager", None)
+    if not poolmanager:
+        return 0
+    pools = poolmanager.pools
+    return sum(pools[key].num_connections for key in pools.keys())
+
+
+breakers = CircuitBreakers(
+    threshold=settings.http_breaker_threshold,
+    reset=settings.http_breaker_reset)
+"""
+Process-wide circuit breakers shared by `sessions` and
+`async_sessions`.
+"""
+
+sessions = SessionPool(
+    maxsize=settings.http_pool_size,
+    timeout=settings.http_timeout,
+    retry=RetryPolicy(settings.http_retries, settings.http_backoff))
+"""
+Process-wide session pool shared by all DsREST requests.
+"""
+
+async_sessions = AsyncSessionPool(
+    maxsize=settings.http_pool_size,
+    timeout=settings.http_timeout,
+    retry=RetryPolicy(settings.http_retries, settings.http_backoff))
+"""
+Process-wide asyncio connection pool shared by all awaited DsREST
+requests.
+"""
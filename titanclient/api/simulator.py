@@ -0,0 +1,426 @@
+"""
+Playlist simulation on a virtual clock.
+
+`simulate` runs a playlist against in-process fake TitanSims instead of
+the simulators it names, with time kept by a `VirtualClock`: waits,
+polling delays and ramp/hold ticks advance the clock instead of
+sleeping, so the whole control flow, including `jumpif` loops around
+waits of several hours, runs in seconds. The resulting
+`SimulationReport` gives the expected timeline of the playlist and the
+number of requests each simulator would receive.
+
+``` python
+>>> from titanclient.api.simulator import simulate
+>>> report = simulate("soak.yaml")
+>>> report.duration
+14400.6
+>>> report.requests["ts11"]
+{'requests': 391, 'reads': 352, 'writes': 39}
+>>> print(report)
+```
+
+The fake simulators serve the scenarios last discovered on each
+endpoint (see `titanclient.api.discovery`), or a small default set.
+Traffic counters grow at the rate set on each scenario. Nothing is sent
+to the real simulators and the discovery cache is left untouched.
+"""
+
+import re
+import json
+import time
+import tempfile
+import threading
+
+import requests
+from requests.adapters import BaseAdapter
+from prettytable import PrettyTable
+
+from ..api import playlist as _playlist
+from ..api.session import sessions
+from ..api.discovery import discovery_cache
+
+SCENARIOS = [
+    ["EG_A", "SG1", "0010PsPs_A", ["Registration", "CallOrig"], ["call"]],
+    ["EG_B", "SG1", "0010PsPs_B", ["Registration", "CallTerm"], ["call"]],
+    ["EG_C", "SG2", "0500PsPs_SMS_A", ["Registration", "MessageOrig"], ["sms"]],
+]
+"""
+Scenarios of simulators without discovery data, as [entity group,
+group, name, traffic cases, tags] lists
+"""
+
+GENERATING = ("CallOrig", "MessageOrig")
+"""
+Traffic cases whose target rate drives the scenario counters
+"""
+
+
+class VirtualClock:
+
+    """
+    Clock that advances only when slept on. Threads started by a
+    playlist step enter the time of the step with `enter` and keep
+    their own time until they `leave`; the step then `join`s the latest
+    of them, as if they had run concurrently.
+    """
+
+    virtual = True
+
+    def __init__(self, epoch=None):
+        self.epoch = time.time() if epoch is None else epoch
+        "Wall clock time at virtual time 0"
+        self.timeline = []
+        "(virtual time, step index, operation) of each step executed"
+        self._now = 0.0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<VirtualClock {self.monotonic():.1f}s>"
+
+    def monotonic(self):
+        """
+        Return virtual seconds since the clock was created.
+        """
+        now = getattr(self._local, "now", None)
+        return self._now if now is None else now
+
+    def time(self):
+        """
+        Return the virtual wall clock time.
+        """
+        return self.epoch + self.monotonic()
+
+    def sleep(self, secs, cancel=None):
+        """
+        Advance the time of the calling thread by `secs`.
+        """
+        if getattr(self._local, "now", None) is None:
+            with self._lock:
+                self._now += max(secs, 0)
+        else:
+            self._local.now += max(secs, 0)
+
+    def fork(self):
+        """
+        Return the time to `enter` in threads started now.
+        """
+        return self.monotonic()
+
+    def enter(self, now):
+        self._local.now = now
+
+    def leave(self):
+        now, self._local.now = self.monotonic(), None
+        return now
+
+    def join(self, ends):
+        """
+        Advance the time of the calling thread to the latest of `ends`.
+        """
+        ends = [ end for end in ends if end is not None ]
+        if not ends:
+            return
+        if getattr(self._local, "now", None) is None:
+            with self._lock:
+                self._now = max([ self._now ] + ends)
+        else:
+            self._local.now = max([ self._local.now ] + ends)
+
+    def record(self, op):
+        """
+        Add the start of playlist step `op` to `timeline`.
+        """
+        if not op.idx.strip():
+            return
+        with self._lock:
+            self.timeline.append((self.monotonic(), op.idx.strip(), type(op).__name__.lower()))
+
+
+class FakeTitanSim:
+
+    """
+    In-process model of the DsREST API of one TitanSim running
+    `scenarios` (see `SCENARIOS`), with time taken from `clock`.
+    """
+
+    def __init__(self, scenarios=None, clock=None):
+        self.clock = clock or VirtualClock()
+        self.scenarios = {}
+        for eg, group, name, cases, tags in scenarios or SCENARIOS:
+            self.scenarios[name] = {"eg": eg, "group": group, "cases": list(cases), "tags": list(tags or [])}
+        self.rates = {(name, case): 1.0 for name, s in self.scenarios.items() for case in s["cases"]}
+        self.running = {name: False for name in self.scenarios}
+        self.requests = 0
+        "Bundles received"
+        self.reads = 0
+        "Requests received without any set request, not counting child requests"
+        self.writes = 0
+        "Requests received with a set request at any level, not counting child requests"
+        self._since = {name: None for name in self.scenarios}
+        self._count = {name: 0.0 for name in self.scenarios}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<FakeTitanSim ({len(self.scenarios)})>"
+
+    def handle(self, bundle):
+        """
+        Return the DsREST response to request bundle `bundle`.
+        """
+        with self._lock:
+            self.requests += 1
+            for request in bundle.get("requests", []):
+                if _writes(request):
+                    self.writes += 1
+                else:
+                    self.reads += 1
+            return {"contentList": [self._eval(r, [], []) for r in bundle.get("requests", [])]}
+
+    def total(self, name):
+        """
+        Return the traffic counter of scenario `name`.
+        """
+        self._update(name)
+        return int(self._count[name])
+
+    def _rate(self, name):
+        cases = [ c for c in self.scenarios[name]["cases"] if c in GENERATING ]
+        return self.rates.get((name, cases[0]), 0) if cases else 1.0
+
+    def _update(self, name):
+        # add the traffic since the last update at the current rate
+        now = self.clock.time()
+        if self.running[name]:
+            self._count[name] += (now - self._since[name]) * self._rate(name)
+        self._since[name] = now
+
+    def _run(self, name, on):
+        self._update(name)
+        self.running[name] = on
+
+    def _eval(self, request, parents, idxs):
+        method = "setData" if "setData" in request else "getData"
+        r = request[method]
+        params = {}
+        for p in r.get("params", []):
+            v = p["paramValue"]
+            m = re.match(r"%Parent(\d+)(::idx)?%", str(v))
+            if m:
+                n = int(m.group(1))
+                v = idxs[n] if m.group(2) else parents[n]
+            params[p["paramName"]] = v
+        ptc = r.get("ptcname")
+        if ptc is not None:
+            m = re.match(r"%Parent(\d+)%", str(ptc))
+            if m:
+                ptc = parents[int(m.group(1))]
+        try:
+            value = self._value(r["source"], r["element"], params, ptc, method == "setData", r.get("content"))
+        except (KeyError, IndexError, ValueError):
+            return {"node": {"val": "", "tp": 0}}
+        children = r.get("children", [])
+        timeline = r.get("timeline")
+
+        def _node(v, i):
+            node = {"val": str(v), "tp": 4}
+            if timeline:
+                now = int(self.clock.time())
+                start = timeline["since"] or now - timeline["maxpoints"] * timeline["period"]
+                xs = [ x for x in range(int(start) + 1, now + 1) if x % timeline["period"] == 0 ]
+                xs = xs[-timeline["maxpoints"]:]
+                node["timeline"] = {"x": xs, "y": [str(v)] * len(xs)}
+            if children:
+                node["childVals"] = [ self._eval(c, parents + [v], idxs + [i]) for c in children ]
+            return {"node": node}
+
+        if isinstance(value, list):
+            return {"list": [ _node(v, i) for i, v in enumerate(value) ]}
+        return _node(value, 0)
+
+    def _value(self, source, element, params, ptc, is_set, content):
+        sc = params.get("Scenario")
+        if source == "Setup":
+            if element == "tCName":
+                return list(self.scenarios.keys())
+            if element == "tags":
+                return self.scenarios[list(self.scenarios)[int(params["tCIDx"])]]["tags"]
+            if element == "resetStatButton":
+                for name in self.scenarios:
+                    self._update(name)
+                    self._count[name] = 0.0
+                return "0"
+            return ""
+        if source == "DataSource":
+            return ""
+        if element == "EntityGroups":
+            return list(dict.fromkeys(s["eg"] for s in self.scenarios.values()))
+        if element == "Scenarios":
+            return [ name for name, s in self.scenarios.items() if s["eg"] == params["EntityGroup"] ]
+        if element == "TrafficCases":
+            return self.scenarios[sc]["cases"]
+        if element == "ScGroupOfSc":
+            return self.scenarios[sc]["group"]
+        if element == "ReadyToRun":
+            return "[led:green]ReadyToRun"
+        if element in ("Start", "Stop"):
+            for name in self.scenarios:
+                self._run(name, element == "Start")
+            return "1"
+        if element == "Exit":
+            return "1"
+        if element == "ScGrpStart":
+            if is_set:
+                for name, s in self.scenarios.items():
+                    if s["group"] == self.scenarios[sc]["group"]:
+                        self._run(name, content == "true")
+            return "true" if self.running[sc] else "false"
+        if element == "ScGrpScStatus":
+            return "[led:green]loadgen - Running" if self.running[sc] else "[led:blue]preamble - Idle"
+        if element == "ScStatus":
+            return "Running" if self.running[sc] else "Idle"
+        if element == "ScIsWeighted":
+            return "Decl"
+        if element == "Phases":
+            return ["preamble", "loadgen", "postamble"]
+        if element == "TcTargetCPSOrWeight":
+            key = (sc, params["TrafficCase"])
+            if is_set:
+                self._update(sc)
+                self.rates[key] = float(content)
+            return self.rates.get(key, 0.0)
+        if element == "TcGoS":
+            return 100.0
+        if element == "TcStat":
+            total = self.total(sc)
+            return {"Starts": total, "Success": total, "Fail": 0}[params["Statistic"]]
+        if source.endswith("_DS"):
+            if element in ("nofTotal", "nofSucc"):
+                return self.total(ptc)
+            if element == "nofUnsucc":
+                return 0
+            if element.startswith("gos"):
+                return "[led:green]100.0"
+            return 1.0
+        return ""
+
+
+class FakeAdapter(BaseAdapter):
+
+    """
+    `requests` transport adapter answering DsREST requests with a
+    `FakeTitanSim`. Mount it with `titanclient.api.session.SessionPool.mount`.
+    """
+
+    def __init__(self, sim):
+        super().__init__()
+        self.sim = sim
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+        response.status_code = 200
+        response.reason = "OK"
+        response.encoding = "utf-8"
+        if request.method == "POST":
+            body = request.body.decode("utf-8") if isinstance(request.body, bytes) else request.body
+            response._content = json.dumps(self.sim.handle(json.loads(body))).encode("utf-8")
+        else:
+            response._content = b"ok"
+        return response
+
+    def close(self):
+        pass
+
+
+class SimulationReport:
+
+    """
+    Outcome of a simulated playlist run.
+    """
+
+    def __init__(self, playlist_path, clock, sims, wall):
+        self.playlist_path = playlist_path
+        self.duration = clock.monotonic()
+        "Virtual seconds the playlist would take"
+        self.wall = wall
+        "Seconds the simulation took"
+        self.timeline = list(clock.timeline)
+        "(virtual time, step index, operation) of each step executed"
+        self.requests = {
+            name: {"requests": sim.requests, "reads": sim.reads, "writes": sim.writes}
+            for name, sim in sims.items() }
+        "Request counts per simulator"
+
+    def __repr__(self):
+        return f"<SimulationReport {self.duration:.1f}s>"
+
+    def __str__(self):
+        steps = {}
+        for t, idx, op in self.timeline:
+            step = steps.setdefault(idx, {"op": op, "runs": 0, "first": t, "last": t})
+            step["runs"] += 1
+            step["last"] = t
+
+        t = PrettyTable(["step", "operation", "runs", "first start", "last start"])
+        t.align["step"] = "r"
+        t.align["operation"] = "l"
+        t.align["runs"] = "r"
+        for idx, step in sorted(steps.items(), key=lambda i: [ int(n) for n in i[0].split(".") ]):
+            t.add_row([ idx, step["op"], step["runs"], _duration(step["first"]), _duration(step["last"]) ])
+
+        r = PrettyTable(["simulator", "requests", "reads", "writes"])
+        r.align["simulator"] = "l"
+        for name, counts in self.requests.items():
+            r.add_row([ name, counts["requests"], counts["reads"], counts["writes"] ])
+
+        return "{}\n{}\n{}\nexpected duration {}, simulated in {:.1f}s".format(
+            self.playlist_path, t, r, _duration(self.duration), self.wall)
+
+
+def simulate(filepath, outdir=None, parallelism=None, scenarios=None):
+    """
+    Run the playlist `filepath` against fake TitanSims on a virtual
+    clock and return a `SimulationReport`. `scenarios` overrides the
+    scenario list of all simulators (see `SCENARIOS`).
+    """
+    clock = VirtualClock()
+    playlist = _playlist.Playlist(
+        filepath, outdir=outdir, parallelism=parallelism, clock=clock, checkpoint=False)
+
+    sims = {}
+    urls = []
+    for name, settings in playlist._pool.items():
+        url = settings["client"].url
+        sims[name] = FakeTitanSim(scenarios or discovery_cache.latest(url), clock)
+        sessions.mount(url, FakeAdapter(sims[name]))
+        urls.append(url)
+
+    cachedir = discovery_cache.cachedir
+    start = time.monotonic()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            discovery_cache.cachedir = tmp
+            playlist.run()
+    finally:
+        discovery_cache.cachedir = cachedir
+        for url in urls:
+            sessions.unmount(url)
+
+    return SimulationReport(playlist.playlist_path, clock, sims, time.monotonic() - start)
+
+
+def _writes(request):
+    if "setData" in request:
+        return True
+    return any(_writes(child) for child in request["getData"].get("children", []))
+
+
+def _duration(secs):
+    hours, rest = divmod(secs, 3600)
+    minutes, secs = divmod(rest, 60)
+    return "{:d}:{:02d}:{:04.1f}".format(int(hours), int(minutes), secs)
+
+
+__all__ = ["simulate", "SimulationReport", "VirtualClock", "FakeTitanSim", "FakeAdapter"]
@@ -0,0 +1,169 @@
+"""
+Tabular decoding of DsREST batch responses.
+
+`APIClient.batch` requests have a fixed shape: one request per
+scenario, each with one child request per stat. `BatchDecoder` is built
+alongside the request and maps the response straight into a
+preallocated `BatchTable` of (scenario, stat) values in a single pass,
+instead of building a dict per response node and merging them
+afterwards.
+
+``` python
+>>> t = client.table(["call_total", "call_cps"])
+>>> t.get("0010PsPs_A", "call_total")
+1221
+>>> t.column("call_total")
+[1221, None, 310]
+>>> t.array()
+array([[1221.  ,    4.2 ],
+       [    nan,    nan],
+       [ 310.  ,    1.  ]])
+```
+
+NumPy is only needed for `BatchTable.array` and `BatchTable.columns`
+with `numpy=True`.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class BatchTable:
+
+    """
+    Table of batch values with one row per scenario and one column per
+    stat. Cells of stats that don't apply to a scenario are None and
+    left out of `to_dict`.
+    """
+
+    def __init__(self, scenarios, stats, fields):
+        self.scenarios = list(scenarios)
+        "Row scenario names"
+        self.stats = list(stats)
+        "Column stat names"
+        self.values = [None] * (len(self.scenarios) * len(self.stats))
+        "Row-major cell values"
+        self._fields = fields
+        self._rows = None
+
+    def __repr__(self):
+        return f"<BatchTable {len(self.scenarios)}x{len(self.stats)}>"
+
+    def __len__(self):
+        return len(self.scenarios)
+
+    def get(self, scenario, stat):
+        """
+        Return the value of `stat` for `scenario`.
+        """
+        return self.values[self._row(scenario) * len(self.stats) + self.stats.index(stat)]
+
+    def row(self, scenario):
+        """
+        Return a dict of stat to value for `scenario`.
+        """
+        i = self._row(scenario) * len(self.stats)
+        return dict(zip(self.stats, self.values[i:i + len(self.stats)]))
+
+    def column(self, stat):
+        """
+        Return the values of `stat` in row order.
+        """
+        return self.values[self.stats.index(stat)::len(self.stats)]
+
+    def columns(self, numpy=False):
+        """
+        Return a dict of stat to column values. With `numpy`, columns
+        are float arrays with NaN for missing values.
+        """
+        if numpy:
+            return {stat: _array(self.column(stat)) for stat in self.stats}
+        return {stat: self.column(stat) for stat in self.stats}
+
+    def array(self):
+        """
+        Return a 2D float array of the table with NaN for missing
+        values.
+        """
+        return _array(self.values).reshape(len(self.scenarios), len(self.stats))
+
+    def to_dict(self):
+        """
+        Return the table as a `{scenario: {stat: value}}` dict, as
+        returned by `APIClient.batch`.
+        """
+        width = len(self.stats)
+        data = {}
+        for i, name in enumerate(self.scenarios):
+            values = data[name] = {}
+            for column, _ in self._fields[i]:
+                values[self.stats[column]] = self.values[i * width + column]
+        return data
+
+    def _row(self, scenario):
+        if self._rows is None:
+            self._rows = {name: i for i, name in enumerate(self.scenarios)}
+        return self._rows[scenario]
+
+
+class BatchDecoder:
+
+    """
+    Decoder of batch responses. `scenarios` are the names of the
+    scenario requests in bundle order, `stats` the table columns and
+    `fields` a list of (column, cast) pairs per scenario, in the order
+    of its child requests.
+    """
+
+    def __init__(self, scenarios, stats, fields):
+        self.scenarios = list(scenarios)
+        self.stats = list(stats)
+        self.fields = fields
+
+    def __repr__(self):
+        return f"<BatchDecoder {len(self.scenarios)}x{len(self.stats)}>"
+
+    def decode(self, content):
+        """
+        Return a `BatchTable` of the DsREST response `contentList`.
+        """
+        table = BatchTable(self.scenarios, self.stats, self.fields)
+        values = table.values
+        width = len(self.stats)
+
+        for i, item in enumerate(content):
+            node = _node(item)
+            if node is None:
+                continue
+            if node.get("val") is not None:
+                table.scenarios[i] = node["val"]
+            offset = i * width
+            for (column, cast), child in zip(self.fields[i], node.get("childVals") or []):
+                values[offset + column] = _value(child, cast)
+
+        return table
+
+
+def _node(item):
+    if not item:
+        return None
+    if "list" in item:
+        return (item["list"] or [{}])[0].get("node")
+    return item.get("node")
+
+
+def _value(item, cast):
+    if "list" in item:
+        return [_value(i, cast) for i in item["list"] or []]
+    try:
+        return cast(item["node"].get("val"))
+    except (KeyError, AttributeError, TypeError, ValueError):
+        return None
+
+
+def _array(values):
+    if numpy is None:
+        raise ImportError("numpy is required for array output")
+    return numpy.array([numpy.nan if v is None else v for v in values], dtype=float)
@@ -19,6 +19,10 @@ from ..host import hosts
 from ..host.files.config import Config
 from ..host.connection import progress_bar
 from ..api.client import APIClient
+from ..api.fleet import Fleet
+from ..api import monitor
+from ..api.monitor import Monitor
+from ..api import simulator
 from ..api.playlist import Playlist
 from ..stats.collections import Values
 from ..stats.statistics import Statistics, load_from_directory
@@ -301,8 +305,18 @@ def playlist():
 
 
 @playlist.command("run", help="execute YAML playlist", cls=GAC)
-def run_playlist(playlist, dry_run=False, outdir=None):
-    Playlist(playlist, outdir=outdir, dry_run=dry_run).run()
+@click.argument("playlist")
+@click.option("-d", "--dry_run", is_flag=True, help="print playlist steps only")
+@click.option("-o", "--outdir", help="stats output directory")
+@click.option("-p", "--parallelism", type=int, help="max simulators per step at a time")
+@click.option("--simulate", is_flag=True,
+              help="run against fake simulators on a virtual clock and report timeline and request counts")
+@click.option("-r", "--resume", is_flag=True, help="continue an interrupted run after its last completed step")
+def run_playlist(playlist, verbose, dry_run=False, outdir=None, parallelism=None, simulate=False, resume=False):
+    if simulate:
+        click.echo(simulator.simulate(playlist, outdir=outdir, parallelism=parallelism))
+        return
+    Playlist(playlist, outdir=outdir, dry_run=dry_run, parallelism=parallelism, resume=resume).run()
 
 
 @api.group(help="query and change runtime stats values")
@@ -320,16 +334,42 @@ def list_stats(verbose):
 @click.option("-s", "--stat", "stats", multiple=True, required=True,
               help="stat name to dump (multiple)")
 def get_stats(host_ids, stats, verbose):
-    data = {}
-    for hc in hosts.hosts(host_ids=host_ids):
-        data[hc] = hc.api.batch(stats)
+    fleet = Fleet({hc.id: hc.api for hc in hosts.hosts(host_ids=host_ids)})
+    data = fleet.batch(list(stats))
 
-    table = PrettyTable(["host id"] + sorted(stats))
-    for hc, values in data.items():
-        table.add_row([hc.id] + [ values.get(s) for s in sorted(stats)])
+    table = PrettyTable(["host id", "scenario"] + sorted(stats))
+    for host_id, scenarios in data.items():
+        for scenario, values in scenarios.items():
+            table.add_row([host_id, scenario] + [ values.get(s) for s in sorted(stats)])
 
     print(table)
 
+    for host_id, error in data.errors.items():
+        logger.error(f"{host_id}: {error}")
+
+
+@stats.command("watch", help="continuously show changed stat values and rates", cls=GAC)
+@click.option("-i", "--host_id", "host_ids", help="host ID", multiple=True)
+@click.option("-s", "--stat", "stats", multiple=True, required=True,
+              help="stat name to watch (multiple)")
+@click.option("-p", "--period", type=float, default=5, help="polling period in seconds")
+@click.option("-n", "--count", type=int, help="number of polls (default: until interrupted)")
+@click.option("--history", type=int, default=60, help="samples kept per stat")
+@click.option("--filter", "name_filter", default="", help="scenario name filter")
+@click.option("--format", default="ndjson", help="output format (ndjson or table)")
+def watch_stats(host_ids, stats, period, count, history, name_filter, format, verbose):
+    if format not in ["ndjson", "table"]:
+        raise ValueError(f"unrecognized format: {format}")
+
+    m = Monitor(
+        {hc.id: hc.api for hc in hosts.hosts(host_ids=host_ids)},
+        list(stats),
+        period=period,
+        history=history,
+        name_filter=name_filter)
+
+    m.run(monitor.ndjson if format == "ndjson" else monitor.table, count=count)
+
 
 @stats.command("set", help="set stat values", cls=GAC)
 def set_stats(verbose, json_file=None, value=None):
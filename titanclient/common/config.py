@@ -7,6 +7,18 @@ defaults = {
     "loglevel": "INFO",
     "logdir": "/tmp/titanclient",
     "cachedir": "~/.cache/titanclient",
+    "http_pool_size": 10,
+    "http_timeout": 5,
+    "http_retries": 2,
+    "http_backoff": 0.2,
+    "http_breaker_threshold": 3,
+    "http_breaker_reset": 30,
+    "discovery_ttl": 300,
+    "ssh_idle_timeout": 300,
+    "ssh_check_interval": 30,
+    "ssh_max_channels": 8,
+    "ssh_fetch_streams": 1,
+    "ssh_fetch_codec": "auto",
     "path": "~/.config/titanclient/config.toml"}
 
 settings = SimpleNamespace(**defaults)
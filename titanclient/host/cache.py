@@ -1,4 +1,5 @@
 import os
+import json
 import shutil
 import pickle
 
@@ -21,7 +22,12 @@ def cache(
     to `cls`.
 
     On subsequent calls, return the cached/pickled class instance from
-    local cache storage until the cache is deleted.
+    local cache storage until the cache is deleted. Files that are
+    missing locally or were modified remotely are fetched again, only
+    from the end of the local copy if the remote file grew (see
+    `SSHClient.fetch`). If `cls` has an `update` method, it's called
+    on the pickled instance with the fetched paths instead of creating
+    a new one.
     """
 
     # set up local paths
@@ -38,19 +44,17 @@ def cache(
     modified = []
     for attr in remote:
         local_path = os.path.join(path_cache_path, attr.filename)
-        if os.path.exists(local_path):
-            local_mtime = os.path.getmtime(local_path)
-            if local_mtime < attr.st_mtime:
-                modified.append(attr)
+        if not os.path.exists(local_path) or os.path.getmtime(local_path) < attr.st_mtime:
+            modified.append(attr)
 
     # return current pickled data in case no updates were found
     pickle_path = os.path.join(path_cache_path, cls.__name__ + ".bin")
 
-    if modified and os.path.exists(pickle_path):
+    if modified and os.path.exists(pickle_path) and not hasattr(cls, "update"):
         logger.debug(f"delete cache {name} (updates found)")
         os.remove(pickle_path)
 
-    if os.path.exists(pickle_path):
+    if not modified and os.path.exists(pickle_path):
         with open(pickle_path, "br") as f:
             logger.debug(f"load cache {pickle_path}")
             return pickle.load(f)
@@ -64,22 +68,62 @@ def cache(
     logger.debug(f"fetch {cls.__name__} of {name} on {client.config.hostname}")
 
     # fetch remote files
-    client.ssh.fetch(
-        modified or remote,
+    fetched = client.ssh.fetch(
+        modified,
         remote_path,
         path_cache_path,
         poller=poller)
 
-    # instantiate data class and pickle it for later
-    data = cls(path_cache_path, name=name)
-
-    with open(pickle_path, "bw") as f:
+    # update the pickled data with the fetched files, or instantiate
+    # the data class, and pickle it for later
+    if os.path.exists(pickle_path):
+        with open(pickle_path, "br") as f:
+            logger.debug(f"update cache {pickle_path}")
+            data = pickle.load(f)
+        data.update(fetched)
+    else:
+        data = cls(path_cache_path, name=name)
+
+    tmp = f"{pickle_path}.{os.getpid()}.tmp"
+    with open(tmp, "bw") as f:
         logger.debug(f"dump cache {pickle_path}")
         pickle.dump(data, f)
+    os.replace(tmp, pickle_path)
 
     return data
 
 
+def load_index(client, log_path):
+    """
+    Return the log directory index of `client` saved by `save_index`
+    for `log_path`, or an empty dict.
+    """
+    path = _index_path(client)
+    try:
+        with open(path, "r") as f:
+            index = json.load(f)
+    except (IOError, ValueError):
+        return {}
+    return index if index.get("log_path") == log_path else {}
+
+
+def save_index(client, log_path, index):
+    """
+    Save the log directory index of `client` (the remote time of the
+    listing and an entry per log directory).
+    """
+    path = _index_path(client)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(dict(index, log_path=log_path), f)
+    os.replace(tmp, path)
+
+
+def _index_path(client):
+    return os.path.join(os.path.expanduser(settings.cachedir), str(client.id), "logs.json")
+
+
 def clear_cache(log):
     p = log.cache_path()
     if os.path.exists(p):
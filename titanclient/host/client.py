@@ -2,11 +2,14 @@
 
 import os
 import re
+import sys
 import time
+import shlex
 from datetime import datetime
 
 from ..common.util import retry, uuid, LenientNamespace
 from ..host.log import Log
+from ..host.cache import load_index, save_index
 from ..host.connection import SSHClient
 from ..api.client import APIClient
 
@@ -58,11 +61,11 @@ class HostClient:
         return HostClient(config=vars(self.config))
 
     def list_dir(self, path, regex=".*"):
-        sftp = self.ssh.sftp()
         files = []
-        for attr in sftp.listdir_attr(path):
-            if re.match(regex, attr.filename):
-                files.append(attr)
+        with self.ssh.lease() as ssh, ssh.open_sftp() as sftp:
+            for attr in sftp.listdir_attr(path):
+                if re.match(regex, attr.filename):
+                    files.append(attr)
 
         return files
 
@@ -168,71 +171,59 @@ class HostClient:
 
         wait_to_kill_mctr()
 
-    def logs(self):
+    def logs(self, rescan=False):
         """
         Return a list of Log objects representing the executions
         found in the install directory on the Host.
-        """
 
-        # use single quotes to prevent evaluation of shell code
+        Log directories, config file times and available data are
+        listed in a single remote command. Directories that haven't
+        changed since the previous listing are taken from a local
+        index (see `titanclient.host.cache.load_index`) instead of
+        being scanned again, unless `rescan` is set.
+        """
         log_path = f"{self.config.install_dir}/log/"
 
-        find_log = (
-            f"find '{log_path}' -maxdepth 1 -type d -printf \"%p\\n\" | "
-            f"xargs stat -c \"%n %Y\"")
-
-        find_cfg = (
-            f"find '{log_path}'*/ -name '*.cfg' -type f -printf \"%p\\n\" | "
-            f"xargs stat -c \"%n %Y\"")
-
-        find_txt = (
-            f"find '{log_path}'*/ -name stat -type d;"
-            f"find '{log_path}'*/ -name '*.evs.ec.csv' -type f;"
-            f"find '{log_path}'*/ -name '*.evs.txt' -type f;")
-
-        log_out, log_err, log_status = self.ssh.run(find_log)
-        cfg_out, cfg_err, cfg_status = self.ssh.run(find_cfg)
-        txt_out, txt_err, txt_status = self.ssh.run(find_txt)
-
-        data_available = {}
-        path = None
-
-        for line in txt_out.strip("\n").split("\n"):
-
-            if not line.strip():
-                continue
-
-            path, txt = line.rsplit("/", 1)
-            data_available[path] = data_available.get(path, {})
-            data = None
-
-            if txt == "stat":
-                data = "gpl"
-            if txt.endswith("ec.csv"):
-                data = "status_codes"
-            if txt.endswith("evs.txt"):
-                data = "latency"
-
-            if data:
-                data_available[path][data] = True
-            else:
-                data_available[path][data] = False
-
-            data_available[path]["config"] = True
-
-        logs = []
-        logs_list = log_out.strip("\n").split("\n")[1:]
-
-        for log in logs_list:
-            log_path, log_age = log.split(" ")
-            i = cfg_out.find(log_path)
-            j = cfg_out.find(" ", i)
-            cfg_age = cfg_out[j:j+11] if i >= 0 and j >= 0 else log_age
-            logs.append(
-                Log(path=log_path,
-                    runtime=int(log_age) - int(cfg_age),
-                    available=data_available.get(log_path, {}),
-                    client=self))
+        index = {} if rescan else load_index(self, log_path)
+        known = index.get("logs", {})
+        since = int(index.get("scanned", 0)) - 2 if known else 0
+
+        # NUL-separated (type, path, value) triples, see _parse_logs
+        listing = (
+            "printf 'n\\0\\0%s\\0' \"$(date +%s)\"; "
+            f"find {shlex.quote(log_path)} -mindepth 1 -maxdepth 1 -type d -printf 'd\\0%p\\0%T@\\0'; "
+            f"find {shlex.quote(log_path)} -mindepth 1 -maxdepth 1 -type d -newermt @{since} -print0 | "
+            f"{_SCAN_LOGS}")
+
+        out, err, status = self.ssh.run(listing)
+        _check_listing(status, err)
+        now, dirs, cfgs, available = _parse_logs(out, log_path)
+
+        # directories that predate the last listing but aren't indexed
+        # (e.g. moved in with their times preserved)
+        missing = [p for p, mtime in dirs.items() if p not in known and mtime <= since]
+        if missing:
+            paths = "\0".join(missing).encode("UTF-8") + b"\0"
+            out, err, status = self.ssh.run(_SCAN_LOGS, stdin=paths)
+            _check_listing(status, err)
+            _, _, more_cfgs, more_available = _parse_logs(out, log_path)
+            cfgs.update(more_cfgs)
+            available.update(more_available)
+
+        entries = {}
+        for path, mtime in dirs.items():
+            entry = known.get(path)
+            if entry is None or mtime > since:
+                entry = {
+                    "mtime": mtime,
+                    "runtime": int(mtime) - int(cfgs.get(path, mtime)),
+                    "available": available.get(path, {})}
+            entries[path] = entry
+
+        save_index(self, log_path, {"scanned": now, "logs": entries})
+
+        logs = [Log(path=path, runtime=e["runtime"], available=e["available"], client=self)
+                for path, e in entries.items()]
 
         return sorted(logs, key=lambda i: i.name)
 
@@ -257,3 +248,52 @@ class HostClient:
 
     def pm(self):
         raise NotImplementedError()
+
+
+_SCAN_LOGS = (
+    "xargs -0 -r sh -c '"
+    "find \"$@\" -mindepth 1 "
+    "\\( -name \"*.cfg\" -type f -printf \"c\\0%p\\0%T@\\0\" \\) -o "
+    "\\( -name stat -type d -printf \"a\\0%p\\0gpl\\0\" \\) -o "
+    "\\( -name \"*.evs.ec.csv\" -type f -printf \"a\\0%p\\0status_codes\\0\" \\) -o "
+    "\\( -name \"*.evs.txt\" -type f -printf \"a\\0%p\\0latency\\0\" \\)' sh")
+"""
+Remote command scanning the log directories read from stdin (NUL
+separated) for config files and data
+"""
+
+
+def _check_listing(status, error):
+    # xargs exits with 123 if find failed on some paths (e.g. without
+    # permission), which still lists the others
+    if status not in (0, 123):
+        raise IOError(f"log listing failed ({status}): {error.strip()}")
+
+
+def _parse_logs(output, log_path):
+    """
+    Parse the NUL-separated (type, path, value) triples of a log
+    listing into the remote time, the mtime of each log directory, the
+    oldest config file mtime of each log and the data available in
+    each log.
+    """
+    now = 0
+    dirs = {}
+    cfgs = {}
+    available = {}
+    fields = output.split("\0")
+
+    for kind, path, value in zip(fields[0::3], fields[1::3], fields[2::3]):
+        if kind == "n":
+            now = int(value)
+        elif kind == "d":
+            dirs[path] = float(value)
+        else:
+            log = log_path + path[len(log_path):].split("/", 1)[0]
+            if kind == "c":
+                cfgs[log] = min(cfgs.get(log, float(value)), float(value))
+            elif kind == "a" and os.path.dirname(path) == log:
+                available.setdefault(log, {})[value] = True
+                available[log]["config"] = True
+
+    return now, dirs, cfgs, available
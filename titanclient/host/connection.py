@@ -1,22 +1,36 @@
 import os
 import re
 import sys
+import gzip
 import time
+import shlex
 import shutil
 import pickle
+import hashlib
 import logging
 import tarfile
 import datetime
 import threading
-import subprocess
 
 from functools import wraps
-from tempfile import NamedTemporaryFile
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
 import paramiko
 from scp import SCPClient
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
 from ..common.util import LenientNamespace
+from ..common.config import settings
 from ..common.logger import logger
 
 
@@ -50,11 +64,151 @@ def connect(
     return c
 
 
+class TransportPool:
+
+    """
+    Process-wide pool of authenticated SSH connections, one per host
+    and user. Commands, SFTP sessions and transfers of all `SSHClient`
+    objects of a host are opened as channels of the same connection,
+    so `~/.ssh/config` parsing, ProxyCommand start-up and key exchange
+    happen once per host rather than once per operation.
+
+    Connections unused for `idle_timeout` seconds are closed on the
+    next pool access, unless a channel is leased (see `lease`). A
+    connection that hasn't been used for `check_interval` seconds is
+    checked with a keepalive round trip (answered within
+    `check_timeout` seconds) before it's handed out and replaced if
+    it's gone; open connections also send keepalives every
+    `check_interval` seconds. At most `max_channels` leases are open
+    per connection at a time, to stay below the sshd `MaxSessions`
+    limit (10 by default); further leases wait.
+    """
+
+    def __init__(self, idle_timeout=300, check_interval=30, check_timeout=10, max_channels=8):
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self.max_channels = max_channels
+        self._entries = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<TransportPool {len(self._entries)}>"
+
+    def get(self, config):
+        """
+        Return a connected `paramiko.SSHClient` for the host of
+        `config` (a host config with hostname, username and password).
+        """
+        return self._acquire(config)["client"]
+
+    @contextmanager
+    def lease(self, config):
+        """
+        Context manager yielding the connection of `get`, which isn't
+        expired while the context is open. Wait while `max_channels`
+        leases of the connection are open.
+        """
+        entry = self._acquire(config, lease=True)
+        try:
+            entry["channels"].acquire()
+            try:
+                yield entry["client"]
+            finally:
+                entry["channels"].release()
+        finally:
+            with self._lock:
+                entry["busy"] -= 1
+                entry["used"] = time.monotonic()
+
+    def _acquire(self, config, lease=False):
+        key = _key(config)
+        self._expire()
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+
+        with lock:
+            entry = self._entries.get(key)
+            if entry and not self._healthy(entry):
+                logger.debug(f"SSH connection to {config.hostname} lost")
+                self._close(key)
+                entry = None
+            if not entry:
+                client = connect(config.hostname, config.username, config.password)
+                client.get_transport().set_keepalive(self.check_interval)
+                entry = {
+                    "client": client,
+                    "used": time.monotonic(),
+                    "busy": 0,
+                    "channels": threading.BoundedSemaphore(self.max_channels)}
+                with self._lock:
+                    self._entries[key] = entry
+            with self._lock:
+                entry["used"] = time.monotonic()
+                if lease:
+                    entry["busy"] += 1
+            return entry
+
+    def close(self, config=None):
+        """
+        Close the connection to the host of `config`, or all of them.
+        """
+        with self._lock:
+            keys = [_key(config)] if config else list(self._entries.keys())
+        for key in keys:
+            self._close(key)
+
+    def _healthy(self, entry):
+        transport = entry["client"].get_transport()
+        if not transport or not transport.is_active():
+            return False
+        if time.monotonic() - entry["used"] < self.check_interval:
+            return True
+        # a round trip, as sending alone succeeds on a dead TCP peer;
+        # any reply (also a failure) means the server is there
+        check = threading.Thread(
+            target=transport.global_request,
+            args=("keepalive@openssh.com",),
+            kwargs={"wait": True},
+            daemon=True)
+        check.start()
+        check.join(self.check_timeout)
+        return not check.is_alive() and transport.is_active()
+
+    def _expire(self):
+        now = time.monotonic()
+        with self._lock:
+            idle = [key for key, entry in self._entries.items()
+                    if not entry["busy"] and now - entry["used"] > self.idle_timeout]
+        for key in idle:
+            logger.debug(f"close idle SSH connection to {key[0]}")
+            self._close(key)
+
+    def _close(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry:
+            entry["client"].close()
+
+
+def _key(config):
+    return (config.hostname, config.username)
+
+
+transports = TransportPool(
+    idle_timeout=settings.ssh_idle_timeout,
+    check_interval=settings.ssh_check_interval,
+    max_channels=settings.ssh_max_channels)
+"""
+Process-wide SSH connection pool shared by all `SSHClient` objects.
+"""
+
+
 def autoconnect(m):
     @wraps(m)
     def arg_wrapper(self, *args, **kwargs):
-        if not self.client:
-            self.connect()
+        self.connect()
         return m(self, *args, **kwargs)
 
     return arg_wrapper
@@ -62,84 +216,310 @@ def autoconnect(m):
 
 class SSHClient:
 
-    def __init__(self, host):
+    """
+    SSH access to a host through the shared connection of `pool`
+    (default: `transports`).
+    """
+
+    def __init__(self, host, pool=None):
         self.config = host.config
         self.client = None
+        self.pool = pool or transports
+        self.bandwidth = None
+        "Link bandwidth to the host in bytes/s, measured by `fetch`"
 
     def connect(self):
-        self.client = self.fresh()
+        self.client = self.pool.get(self.config)
 
     def disconnect(self):
-
-        if not self.client:
-            return
-
-        self.client.close()
+        # the pooled connection stays open for other clients until it
+        # expires; use reconnect or the pool to close it
         self.client = None
 
     def reconnect(self):
-        self.disconnect()
+        self.pool.close(self.config)
         self.connect()
 
     def fresh(self):
+        """
+        Return a new, unpooled connection.
+        """
         return connect(
             self.config.hostname,
             self.config.username,
             self.config.password)
 
+    def lease(self):
+        """
+        Context manager yielding the pooled connection, kept open
+        while in use, e.g. for long transfers.
+        """
+        return self.pool.lease(self.config)
+
     @autoconnect
     def sftp(self):
         return self.client.open_sftp()
 
-    @autoconnect
-    def run(self, command):
-        stdin, stdout, stderr = self.client.exec_command(command)
-        status = stdout.channel.recv_exit_status()
-        output = stdout.read().decode("UTF-8")
-        error = stderr.read().decode("UTF-8")
+    def run(self, command, stdin=None):
+        """
+        Run `command` and return its output, error output and exit
+        status. `stdin` (bytes) is sent to its standard input, e.g. to
+        pass more arguments than fit on a command line.
+        """
+        with self.lease() as client:
+            channel_in, stdout, stderr = client.exec_command(command)
+            if stdin is not None:
+                channel_in.write(stdin)
+                channel_in.channel.shutdown_write()
+            status = stdout.channel.recv_exit_status()
+            output = stdout.read().decode("UTF-8")
+            error = stderr.read().decode("UTF-8")
         return output, error, status
 
-    @autoconnect
-    def fetch(self, attrs, remote_dir, target_dir, poller=None):
-
-        archive = NamedTemporaryFile(dir="/tmp", suffix=".tar.gz").name
-        manifest = archive.replace(".tar.gz", ".manifest")
-
-        remotes = []
-        for a in attrs:
-            remote_full = os.path.join(remote_dir, a.filename)
-            remotes.append(remote_full)
-
-        with open(manifest, "w") as local:
-            local.write("\n".join(remotes))
-
-        # tarball remote files and transfer them
-        tar_czf = f"tar czf {archive} --files-from {manifest}"
-        sftp = self.sftp()
-        sftp.put(manifest, os.path.join("/tmp", manifest))
-
-        self.run(tar_czf)
-        local_tar = os.path.join(target_dir, os.path.basename(archive))
-
-        transfer = FileTransfer(self, archive, target_dir)
-        transfer.start(poller=poller)
-
-        self.run(f"rm {archive} {manifest}")
-
-        fetched = []
-
-        # strip the remote directory path from files
-        tar = tarfile.open(local_tar)
-        for member in tar.getmembers():
-            if member.isreg():
-                member.name = os.path.basename(member.name)
-                tar.extract(member, path=target_dir)
-                fetched.append(os.path.join(target_dir, member.name))
-
-        subprocess.check_output(["rm", local_tar, manifest])
-
+    def fetch(self, attrs, remote_dir, target_dir, poller=None, streams=None, codec=None):
+        """
+        Fetch the files of `remote_dir` listed in `attrs` (SFTP
+        attributes, see `HostClient.list_dir`) to `target_dir` and
+        return their local paths.
+
+        The files are streamed through `tar` on SSH channels of the
+        pooled connection and extracted as they arrive, so remote
+        compression, transfer and local extraction overlap. With
+        `streams` (default: the `ssh_fetch_streams` setting) above 1,
+        the files are split by size over that many channels fetched
+        concurrently.
+
+        `codec` (default: the `ssh_fetch_codec` setting) compresses the
+        streams: "none", "gzip", "zstd" or "lz4", optionally with a
+        level, e.g. "gzip:1". With "auto", one is picked by
+        `select_codec`.
+
+        Files with a smaller local copy in `target_dir` (an older
+        version of a growing log, or a transfer that was interrupted)
+        are only fetched from the end of that copy, if it's verified
+        to be a prefix of the remote file (see `FileTransfer.resumable`).
+        """
+        if not attrs:
+            return []
+
+        codec = codec or settings.ssh_fetch_codec
+        if codec == "auto":
+            codec = self.select_codec()
+
+        transfer = FileTransfer(self, remote_dir, target_dir, codec=codec)
+        offsets = transfer.resumable(attrs)
+        fetched = transfer.stream(
+            _split(attrs, streams or settings.ssh_fetch_streams, offsets),
+            poller=poller,
+            offsets=offsets)
+
+        status = transfer.status()
+        logger.debug(
+            f"fetched {status['copied']} bytes ({status['wire']} on the wire, {status['codec']}) "
+            f"at {status['throughput'] / 1e6:.1f} MB/s")
+        # the rate of small transfers is mostly channel setup latency
+        if status["wire"] >= 4 * 1024 * 1024:
+            self._measure(status["wire_throughput"], bound=transfer.codec[0] != "none")
         return fetched
 
+    def select_codec(self):
+        """
+        Return the fetch codec for the current state of the host: the
+        compressors installed on it (and locally decodable), the idle
+        share of its cores by the 1-minute load average, and the
+        `bandwidth` of the link as measured by previous fetches.
+
+        Slow links get the strongest of zstd and gzip, fast links the
+        cheapest of lz4, zstd:1 and gzip:1, and links faster than a
+        single core can compress get no compression. Hosts busy
+        generating load (less than a quarter of their cores idle) only
+        get lz4, or gzip:1 on slow links. Until a fetch has measured
+        the link, the cheap lz4 or gzip:1 is used.
+        """
+        output, _, _ = self.run(
+            "nproc; cut -d ' ' -f 1 /proc/loadavg; "
+            "for c in zstd lz4; do command -v $c >/dev/null && echo $c; done")
+        lines = output.split()
+        try:
+            headroom = 1 - float(lines[1]) / int(lines[0])
+        except (IndexError, ValueError):
+            headroom = 1
+        tools = [c for c in lines[2:] if _decodable(c)]
+
+        codec = _choose(tools, headroom, self.bandwidth)
+        link = f"{self.bandwidth / 1e6:.1f} MB/s" if self.bandwidth else "unmeasured"
+        logger.debug(
+            f"codec {codec} for {self.config.hostname} (idle {headroom:.0%}, "
+            f"link {link}, {' '.join(tools) or 'gzip only'})")
+        return codec
+
+    def _measure(self, rate, bound=False):
+        """
+        Fold a throughput sample of `rate` bytes/s into `bandwidth`, a
+        moving average. A `bound` sample, e.g. of a compressed transfer
+        that may have been limited by the compressor, is only a lower
+        bound of the link bandwidth and only folded in if above it.
+        """
+        if self.bandwidth is None:
+            self.bandwidth = rate
+        elif not bound or rate > self.bandwidth:
+            self.bandwidth += 0.3 * (rate - self.bandwidth)
+
+
+def _choose(tools, headroom, bandwidth):
+    """
+    Pick a codec from the available compressor `tools` for a host with
+    `headroom` (idle share of its cores) and a link of `bandwidth`
+    bytes/s, or None if not measured yet (see `SSHClient.select_codec`).
+    """
+    if bandwidth is None:
+        return "lz4" if "lz4" in tools else "gzip:1"
+    if headroom < 0.25:
+        if "lz4" in tools:
+            return "lz4"
+        return "gzip:1" if bandwidth < 10e6 else "none"
+    if bandwidth < 10e6:
+        return "zstd" if "zstd" in tools else "gzip"
+    if bandwidth < 100e6:
+        if "lz4" in tools:
+            return "lz4"
+        return "zstd:1" if "zstd" in tools else "gzip:1"
+    return "none"
+
+
+_COMPRESSORS = {
+    "gzip": ("gzip", 6),
+    "zstd": ("zstd -q", 3),
+    "lz4": ("lz4 -q", 1)}
+
+
+def _codec(spec):
+    """
+    Return the (name, level) of a codec such as "zstd" or "gzip:1".
+    """
+    name, _, level = str(spec or "none").partition(":")
+    if name == "none":
+        return name, None
+    if name not in _COMPRESSORS:
+        raise ValueError(f"unknown codec: {spec}")
+    if not _decodable(name):
+        raise ImportError(f"{name} fetches need the python {name} package")
+    return name, int(level) if level else _COMPRESSORS[name][1]
+
+
+def _decodable(name):
+    return {"zstd": zstandard, "lz4": lz4}.get(name, True) is not None
+
+
+# errors of a corrupt or truncated stream, by decoder
+_DECODE_ERRORS = (tarfile.TarError, OSError, EOFError, RuntimeError) + (
+    (zstandard.ZstdError,) if zstandard else ())
+
+
+def _compressor(codec):
+    name, level = codec
+    if name == "none":
+        return None
+    return f"{_COMPRESSORS[name][0]} -{level}"
+
+
+def _decoder(codec, fileobj):
+    name, _ = codec
+    if name == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+    if name == "zstd":
+        return zstandard.ZstdDecompressor().stream_reader(fileobj)
+    if name == "lz4":
+        return lz4.frame.LZ4FrameFile(fileobj, mode="rb")
+    return fileobj
+
+
+class _Meter:
+
+    """
+    Readable wrapper counting the bytes read from `fileobj`.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.count += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def readable(self):
+        return True
+
+
+def _split(attrs, n, offsets=None):
+    """
+    Split `attrs` into at most `n` groups of about the same total size
+    left to fetch past `offsets`.
+    """
+    offsets = offsets or {}
+
+    def size(a):
+        return (a.st_size or 0) - offsets.get(a.filename, 0)
+
+    groups = [[] for _ in range(max(min(n, len(attrs)), 1))]
+    sizes = [0] * len(groups)
+    for a in sorted(attrs, key=size, reverse=True):
+        i = sizes.index(min(sizes))
+        groups[i].append(a)
+        sizes[i] += size(a)
+    return groups
+
+
+def _missing(error):
+    """
+    Return the names of files tar couldn't find in its `error` output,
+    or an empty list if it reported other errors as well.
+    """
+    missing = []
+    for line in error.splitlines():
+        if line.endswith(": Cannot stat: No such file or directory"):
+            missing.append(line[len("tar: "):].rsplit(": Cannot stat", 1)[0])
+        elif "Exiting with failure status" not in line:
+            return []
+    return missing
+
+
+_PREFIX_DIGESTS = (
+    "xargs -0 -r -n 4 sh -c '"
+    "{ head -c \"$0\" \"$3\"; tail -c +\"$1\" \"$3\" | head -c \"$2\"; } 2>/dev/null | md5sum'")
+"""
+Remote command printing the md5 digest of the head and tail window
+(see `_window`) of each file, read from stdin as NUL-separated (head
+length, tail start, tail length, path) quadruples
+"""
+
+
+def _window(size):
+    """
+    Return the (head length, tail start, tail length) of the parts of
+    the first `size` bytes of a file that are compared to verify a
+    prefix: the first 64 kB and the last 1 MB.
+    """
+    head = min(size, 64 * 1024)
+    start = max(head, size - 1024 * 1024)
+    return head, start, size - start
+
+
+def _digest(path, size):
+    head, start, length = _window(size)
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        md5.update(f.read(head))
+        f.seek(start)
+        md5.update(f.read(length))
+    return md5.hexdigest()
 
 
 class FileTransfer:
@@ -148,13 +528,17 @@ class FileTransfer:
             self,
             client,
             filename,
-            target_dir):
+            target_dir,
+            codec="gzip"):
 
         self.client = client
         self.filename = filename
         self.target_dir = target_dir
+        self.codec = _codec(codec)
 
         self.files = {}
+        self.offsets = {}
+        self.meters = []
 
         self.start_date = None
         self.end_date = None
@@ -162,55 +546,264 @@ class FileTransfer:
         self.poller = None
         self.period = 0.1
         self.last = time.time()
+        # streams update the progress from their own threads
+        self._lock = threading.Lock()
 
     def __repr__(self):
         return f"<FileTransfer {self.filename}>"
 
     def start(self, poller=None):
-        logger.debug(f"fresh SSH session to transfer {self.filename}")
+        logger.debug(f"SCP channel to transfer {self.filename}")
 
         if poller:
             logger.debug(f"set poller: {poller.__name__}")
             self.poller = poller
 
-        ssh = self.client.fresh()
-        c = SCPClient(ssh.get_transport(), progress=self.poll)
+        with self.client.lease() as ssh:
+            c = SCPClient(ssh.get_transport(), progress=self.poll)
+            c.get(self.filename, self.target_dir)
+        self.end_date = datetime.datetime.now()
+
+    def resumable(self, attrs):
+        """
+        Return the local size of each file in `attrs` (SFTP attributes
+        of files in the `filename` directory) that has a smaller local
+        copy in `target_dir`, or a partial one left by an interrupted
+        transfer, whose first 64 kB and last 1 MB match the remote file.
+        All files are checked in a single remote command.
+        """
+        local = {}
+        for a in attrs:
+            path = os.path.join(self.target_dir, a.filename)
+            for p in (path + ".part", path):
+                if os.path.exists(p):
+                    size = os.path.getsize(p)
+                    if 0 < size < (a.st_size or 0):
+                        local[a.filename] = (p, size)
+                    break
+
+        if not local:
+            return {}
+
+        args = []
+        for name, (_, size) in local.items():
+            head, start, length = _window(size)
+            args += [str(head), str(start + 1), str(length), f"{self.filename.rstrip('/')}/{name}"]
+        output, error, status = self.client.run(
+            _PREFIX_DIGESTS,
+            stdin="\0".join(args).encode("UTF-8") + b"\0")
+        digests = [line.split(" ")[0] for line in output.splitlines()]
+        if status != 0 or len(digests) != len(local):
+            logger.warning(
+                f"couldn't check local copies in {self.filename} ({status}: {error.strip()}), "
+                f"fetching {len(local)} files in full")
+            return {}
+
+        offsets = {}
+        for (name, (path, size)), digest in zip(local.items(), digests):
+            if digest == _digest(path, size):
+                offsets[name] = size
+            else:
+                logger.debug(f"fetch {name} in full (local copy is not a prefix)")
+        return offsets
+
+    def stream(self, groups, poller=None, offsets=None):
+        """
+        Fetch each group of files (SFTP attributes of files in the
+        `filename` directory) through a `tar` stream on its own
+        channel, concurrently, and extract them into `target_dir` as
+        they arrive. Files in `offsets` are appended to from that
+        offset instead. Return the local paths of the files.
+        """
+        if poller:
+            logger.debug(f"set poller: {poller.__name__}")
+            self.poller = poller
+
+        self.offsets = offsets or {}
+        self.start_date = datetime.datetime.now()
+        for group in groups:
+            for a in group:
+                size = (a.st_size or 0) - self.offsets.get(a.filename, 0)
+                self.files[a.filename] = {"size": size, "copied": 0, "finished": False}
+
+        os.makedirs(self.target_dir, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=len(groups)) as e:
+            fetched = [path for paths in e.map(self._stream, groups) for path in paths]
 
-        c.get(self.filename, self.target_dir)
         self.end_date = datetime.datetime.now()
-        ssh.close()
+        if self.poller:
+            self.poller(self)
+        return fetched
+
+    def _stream(self, group):
+        names = [a.filename for a in group if a.filename not in self.offsets]
+        fetched = []
+        with self.client.lease() as ssh:
+            for a in group:
+                if a.filename in self.offsets:
+                    fetched.append(self._append(ssh, a, self.offsets[a.filename]))
+            if names:
+                fetched.extend(self._tar(ssh, names))
+        return fetched
+
+    def _tar(self, ssh, names):
+        logger.debug(f"stream {len(names)} files from {self.filename}")
+
+        fetched = []
+        channel = ssh.get_transport().open_session()
+        compressor = _compressor(self.codec)
+        # tar runs the compressor itself, so that its exit status is
+        # that of tar
+        option = f"-I {shlex.quote(compressor)} " if compressor else ""
+        channel.exec_command(f"tar cf - {option}-C {shlex.quote(self.filename)} --null -T -")
+        channel.sendall("\0".join(names).encode("UTF-8") + b"\0")
+        channel.shutdown_write()
+
+        try:
+            with tarfile.open(fileobj=self._decode(channel), mode="r|") as tar:
+                for member in tar:
+                    if not member.isreg():
+                        continue
+                    # strip the remote directory path from files
+                    name = os.path.basename(member.name)
+                    path = os.path.join(self.target_dir, name)
+                    self._extract(tar, member, name, path)
+                    fetched.append(path)
+        except _DECODE_ERRORS as e:
+            failed = e
+            # remote tar may be blocked writing to the channel, so close
+            # it rather than wait for tar to exit
+            channel.close()
+        else:
+            failed = None
+
+        status = channel.recv_exit_status()
+        error = channel.makefile_stderr("rb").read().decode("UTF-8", "replace").strip()
+        channel.close()
+
+        # tar exits with 1 if a file changed while it was read, which is
+        # expected for logs of a running execution, and with 2 if a
+        # file was removed since it was listed, which is skipped
+        missing = _missing(error)
+        if failed or status > 2 or (status == 2 and not missing):
+            raise IOError(f"remote tar failed ({status}): {error or failed}")
+        for name in missing:
+            logger.warning(f"skip {name} of {self.filename}: removed before it was fetched")
+            with self._lock:
+                self.files.pop(name, None)
+        if error:
+            logger.debug(f"remote tar: {error}")
+        return fetched
+
+    def _append(self, ssh, attr, offset):
+        name = attr.filename
+        path = os.path.join(self.target_dir, name)
+        part = path + ".part"
+        size = attr.st_size - offset
+        logger.debug(f"append {size} bytes to {name} from {self.filename}")
+
+        # append to the partial file, so that an interrupted transfer
+        # leaves no local copy that looks up to date
+        if not os.path.exists(part):
+            os.replace(path, part)
+
+        remote = shlex.quote(f"{self.filename.rstrip('/')}/{name}")
+        channel = ssh.get_transport().open_session()
+        compressor = _compressor(self.codec)
+        pipe = f" | {compressor} -c" if compressor else ""
+        channel.exec_command(f"tail -c +{offset + 1} {remote} | head -c {size}{pipe}")
+
+        copied = 0
+        source = self._decode(channel)
+        try:
+            with open(part, "ab") as f:
+                for chunk in iter(lambda: source.read(1024 * 1024), b""):
+                    f.write(chunk)
+                    copied += len(chunk)
+                    self.poll(name, size, copied)
+        except _DECODE_ERRORS as e:
+            channel.close()
+            raise IOError(f"remote file {name} couldn't be fetched: {e}")
+        channel.recv_exit_status()
+        channel.close()
+
+        if copied < size:
+            raise IOError(f"remote file {name} shrank while it was fetched")
+        os.utime(part, (attr.st_mtime, attr.st_mtime))
+        os.replace(part, path)
+        return path
+
+    def _decode(self, channel):
+        meter = _Meter(channel.makefile("rb"))
+        with self._lock:
+            self.meters.append(meter)
+        return _decoder(self.codec, meter)
+
+    def _extract(self, tar, member, name, path):
+        source = tar.extractfile(member)
+        copied = 0
+        # extract to a partial file, which is resumed if interrupted
+        part = path + ".part"
+        with open(part, "wb") as f:
+            for chunk in iter(lambda: source.read(1024 * 1024), b""):
+                f.write(chunk)
+                copied += len(chunk)
+                self.poll(name, member.size, copied)
+        if not member.size:
+            self.poll(name, 0, 0)
+        os.utime(part, (member.mtime, member.mtime))
+        os.replace(part, path)
 
     def status(self):
-        size = sum([d.get("size") for d in self.files.values()])
-        copied = sum([d.get("copied") for d in self.files.values()])
+        """
+        Return the total and copied size of the files, the bytes
+        received on the wire with the codec used, and the throughput
+        of both in bytes/s.
+        """
+        with self._lock:
+            size = sum([d.get("size") for d in self.files.values()])
+            copied = sum([d.get("copied") for d in self.files.values()])
+            files = len(self.files.keys())
+            wire = sum([m.count for m in self.meters])
+        if self.start_date:
+            elapsed = ((self.end_date or datetime.datetime.now()) - self.start_date).total_seconds()
+        else:
+            elapsed = 0
+        name, level = self.codec
         return {"size": size,
                 "copied": copied,
-                "files": len(self.files.keys())}
+                "files": files,
+                "codec": f"{name}:{level}" if level else name,
+                "wire": wire,
+                "throughput": copied / elapsed if elapsed else 0,
+                "wire_throughput": wire / elapsed if elapsed else 0}
 
     def poll(self, name, size, copied):
 
-        if self.end_date:
-            logger.debug(f"fetch complete: {self.filename}")
-            return
+        with self._lock:
+            if self.end_date:
+                logger.debug(f"fetch complete: {self.filename}")
+                return
 
-        if not self.files:
-            self.start_date = datetime.datetime.now()
+            if not self.files:
+                self.start_date = datetime.datetime.now()
+
+            self.files[name] = {
+                "size": size,
+                "copied": copied,
+                "finished": size == copied}
 
-        self.files.setdefault(name, {})
-        self.files[name] = {
-            "size": size,
-            "copied": copied,
-            "finished": size == copied}
+            all_finished = [d.get("finished") for d in self.files.values()]
+            if all(all_finished):
+                self.end_date = datetime.datetime.now()
 
-        all_finished = [d.get("finished") for d in self.files.values()]
-        if all(all_finished):
-            self.end_date = datetime.datetime.now()
+            tick = time.time()
+            due = tick - self.last > self.period
+            if due:
+                self.last = tick
 
-        tick = time.time()
-        if tick - self.last > self.period:
-            self.last = tick
-            if self.poller:
-                self.poller(self)
+        if due and self.poller:
+            self.poller(self)
 
 
 
@@ -18,6 +18,7 @@ class GPLData:
     def __init__(self, pathname=None, regex=None, name=None, connection=None):
         self.name = name if name else ""
         self.stats = dict()
+        self._sources = dict()
 
         if not pathname:
             return
@@ -33,20 +34,86 @@ class GPLData:
 
     def load(self, pathname, fmt="gpl"):
         """
-        Load and parse *.gpl file at `pathname'.
+        Load and parse *.gpl file at `pathname'. A last line without a
+        newline (still being written) is left to `update'.
         """
         try:
-            with open(pathname, "r") as file:
-                self.read(file.read())
+            with open(pathname, "rb") as file:
+                data = file.read()
         except IOError as error:
             raise error
 
+        end = data.rfind(b"\n") + 1
+        string = data[:end].decode("UTF-8")
+        stats = self._read(string)
+        self.stats.update(stats)
+        if not stats:
+            return
+
+        # remember where the file was read up to for update()
+        case_name, origin = self._header(string)
+        self.__dict__.setdefault("_sources", {})[os.path.abspath(pathname)] = {
+            "case": case_name,
+            "origin": origin,
+            "offset": end,
+            "tail": data[max(end - 256, 0):end]}
+
+    def update(self, pathnames):
+        """
+        Read the records appended to each *.gpl file in `pathnames'
+        since it was loaded. Files that weren't loaded, were rewritten
+        or got a new header group are loaded in full.
+        """
+        sources = self.__dict__.setdefault("_sources", {})
+        for pathname in pathnames:
+            source = sources.get(os.path.abspath(pathname))
+            if not source or source["case"] not in self.stats:
+                self.load(pathname)
+                continue
+
+            start = source["offset"] - len(source["tail"])
+            with open(pathname, "rb") as file:
+                file.seek(start)
+                data = file.read()
+            if not data.startswith(source["tail"]):
+                self.load(pathname)
+                continue
+
+            data = data[len(source["tail"]):]
+            end = data.rfind(b"\n") + 1
+            string = data[:end].decode("UTF-8")
+            if "#ValueHeader" in string or "#CaptureGroup" in string:
+                self.load(pathname)
+                continue
+
+            self._append(source, string)
+            source["offset"] += end
+            source["tail"] = (source["tail"] + data[:end])[-256:]
+
     def read(self, string):
         """
         Take a gpl string and read all records and header sets.
         """
         self.stats.update(self._read(string))
 
+    def _header(self, string):
+        date_format = "%Y-%m-%d-%H:%M:%S.%f"
+        case_name = re.findall("#CaptureGroup\[\"(.+)\"\]", string)[0]
+        date_string = re.findall("#TimeStampBase: ([^ ]+)", string)[0]
+        return case_name, datetime.strptime(date_string, date_format)
+
+    def _append(self, source, string):
+        stats = self.stats[source["case"]]
+        # appended records belong to the last header group
+        group = len(stats["header_groups"]) - 1
+        for line in string.splitlines():
+            if line and not line.startswith("#"):
+                row = line.rstrip(" ").split(" ", 2)
+                timestamp = source["origin"] + timedelta(seconds=float(row[1]))
+                stats["record_indices"].append((group, len(stats["records"])))
+                stats["records"].append(row[2])
+                stats["timestamps"].append(timestamp.timestamp())
+
     def _read(self, string):
         header_groups = []
         header_columns = []
@@ -59,10 +126,7 @@ class GPLData:
         if not value_group[1:]:
             return {}
 
-        date_format = "%Y-%m-%d-%H:%M:%S.%f"
-        case_name = re.findall("#CaptureGroup\[\"(.+)\"\]", value_group[0])[0]
-        date_string = re.findall("#TimeStampBase: ([^ ]+)", value_group[0])[0]
-        origin = datetime.strptime(date_string, date_format)
+        case_name, origin = self._header(value_group[0])
 
         column_rx = re.compile(
             "(SIP|MLSimPlus|registration|subscribe|call(Orig|Term)|(?<=[\._])call|"